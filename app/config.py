@@ -3,6 +3,19 @@ from dotenv import load_dotenv
 
 load_dotenv()  # Carrega variáveis do .env
 
+
+def _balancas(valor: str, padrao: str) -> dict:
+    """BALANCAS="entrada=/dev/ttyUSB0;saida=/dev/ttyUSB1" -> {"entrada": "/dev/ttyUSB0", ...}"""
+    if not valor:
+        return {'principal': padrao}
+    out = {}
+    for item in valor.split(';'):
+        if '=' in item:
+            nome, porta = item.split('=', 1)
+            out[nome.strip()] = porta.strip()
+    return out or {'principal': padrao}
+
+
 class Config:
     SQLALCHEMY_DATABASE_URI = os.getenv(
         'DATABASE_URL',
@@ -20,6 +33,36 @@ class Config:
     READ_SLEEP = float(os.getenv('READ_SLEEP', 0.2))
     READ_BYTES = int(os.getenv('READ_BYTES', 100))
 
+    # Leitor contínuo da TC420 (thread em background)
+    TC420_INTERVALO_ENQ = float(os.getenv('TC420_INTERVALO_ENQ', 0.1))    # s entre ENQs
+    TC420_BUFFER_BYTES = int(os.getenv('TC420_BUFFER_BYTES', 4096))       # tamanho do ring buffer
+    TC420_JANELA_S = float(os.getenv('TC420_JANELA_S', 3.0))              # janela deslizante
+    TC420_TOLERANCIA_KG = float(os.getenv('TC420_TOLERANCIA_KG', 20))     # oscilação aceita como estável
+    TC420_PERMANENCIA_S = float(os.getenv('TC420_PERMANENCIA_S', 1.5))    # tempo dentro da tolerância
+    TC420_VALIDADE_S = float(os.getenv('TC420_VALIDADE_S', 2.0))          # leitura mais velha que isso é descartada
+    TC420_RECONEXAO_S = float(os.getenv('TC420_RECONEXAO_S', 2.0))         # backoff inicial
+    TC420_RECONEXAO_MAX_S = float(os.getenv('TC420_RECONEXAO_MAX_S', 30.0))  # teto do backoff
+
+    # Balanças do pátio (id -> porta); sem BALANCAS, uma única "principal" em SERIAL_PORT
+    BALANCAS = _balancas(os.getenv('BALANCAS', ''), SERIAL_PORT)
+    BALANCA_ENTRADA = os.getenv('BALANCA_ENTRADA', next(iter(BALANCAS)))
+    BALANCA_SAIDA = os.getenv('BALANCA_SAIDA', list(BALANCAS)[-1])
+
+    # Quem abre as portas: "local" = thread no próprio processo (dev, um único processo);
+    # "processo" = só o app.hardware.tc420_servidor, que repassa as leituras aos workers
+    # por socket unix (gunicorn.conf.py liga esse modo quando há mais de um worker)
+    BALANCA_LEITOR = os.getenv('BALANCA_LEITOR', 'local')
+    BALANCA_SOCKET = os.getenv('BALANCA_SOCKET', '/tmp/semensol-balancas.sock')
+
+    # Stream de leituras para as telas (/api/balanca/peso/stream)
+    # streams simultâneos por worker: as threads do gthread menos 4 reservadas para a API
+    BALANCA_STREAM_MAX_CLIENTES = int(os.getenv(
+        'BALANCA_STREAM_MAX_CLIENTES', max(int(os.getenv('GUNICORN_THREADS', 16)) - 4, 1)
+    ))
+    BALANCA_STREAM_MAX_HZ = float(os.getenv('BALANCA_STREAM_MAX_HZ', 5))   # eventos/s por cliente
+    BALANCA_STREAM_HEARTBEAT_S = float(os.getenv('BALANCA_STREAM_HEARTBEAT_S', 15))
+    BALANCA_POLL_TIMEOUT_S = float(os.getenv('BALANCA_POLL_TIMEOUT_S', 25))
+
 
 def get_config():
     return Config
@@ -1,30 +1,55 @@
-import serial
 import time
 import re
 import logging
-from app.config import (
-    SERIAL_PORT, SERIAL_BAUDRATE, SERIAL_TIMEOUT,
-    SERIAL_RETRIES, READ_SLEEP, READ_BYTES
-)
+from typing import List, Tuple, TYPE_CHECKING
+from app.config import Config
+
+if TYPE_CHECKING:
+    import serial
+
+# parâmetros ficam em Config (env); o módulo não expõe constantes próprias em app.config
+SERIAL_PORT = Config.SERIAL_PORT
+SERIAL_BAUDRATE = Config.SERIAL_BAUDRATE
+SERIAL_TIMEOUT = Config.SERIAL_TIMEOUT
+SERIAL_RETRIES = Config.SERIAL_RETRIES
+READ_SLEEP = Config.READ_SLEEP
+READ_BYTES = Config.READ_BYTES
+
+ENQ = b'\x05'
+# Quadro da TC420: p` seguido de 12 dígitos (peso * 1e6)
+_PADRAO_QUADRO = re.compile(rb"p`(\d{12})")
+TAMANHO_QUADRO = 14
 
 logger = logging.getLogger(__name__)
 
-def conectar(porta: str = SERIAL_PORT) -> serial.Serial:
+def abrir_porta(porta: str = SERIAL_PORT, timeout: float = SERIAL_TIMEOUT) -> "serial.Serial":
+    """
+    Uma única tentativa de abrir a porta (o leitor em background controla o backoff).
+    Abre em modo exclusivo: um segundo processo na mesma porta falha no open em
+    vez de intercalar ENQs e dividir os quadros.
+    """
+    # import tardio: instalações sem balança sobem sem pyserial
+    import serial
+    return serial.Serial(
+        porta,
+        baudrate=SERIAL_BAUDRATE,
+        bytesize=serial.EIGHTBITS,
+        parity=serial.PARITY_NONE,
+        stopbits=serial.STOPBITS_ONE,
+        xonxoff=False,
+        timeout=timeout,
+        exclusive=True
+    )
+
+def conectar(porta: str = SERIAL_PORT) -> "serial.Serial":
     """
     Estabelece conexão serial com a balança TC420.
     Retorna objeto serial.Serial conectado ou lança exceção após tentativas.
     """
+    import serial
     for attempt in range(1, SERIAL_RETRIES + 1):
         try:
-            ser = serial.Serial(
-                porta,
-                baudrate=SERIAL_BAUDRATE,
-                bytesize=serial.EIGHTBITS,
-                parity=serial.PARITY_NONE,
-                stopbits=serial.STOPBITS_ONE,
-                xonxoff=False,
-                timeout=SERIAL_TIMEOUT
-            )
+            ser = abrir_porta(porta)
             logger.info(f"[TC420] Conectado na porta {porta}")
             return ser
         except serial.SerialException as e:
@@ -33,22 +58,46 @@ def conectar(porta: str = SERIAL_PORT) -> serial.Serial:
 
     raise serial.SerialException(f"Erro: não foi possível abrir a porta {porta} após {SERIAL_RETRIES} tentativas.")
 
-def ler_peso(ser: serial.Serial) -> float:
+def extrair_quadros(buf: bytearray) -> Tuple[List[float], int]:
+    """
+    Extrai todos os quadros completos de `buf` (em kg) e remove do buffer os bytes
+    consumidos. Um quadro parcial no final é preservado para a próxima leitura.
+    Retorna (pesos, falhas), onde falhas conta cabeçalhos `p`` descartados sem
+    12 dígitos válidos (quadro corrompido).
+    """
+    pesos = []
+    fim = 0
+    for match in _PADRAO_QUADRO.finditer(buf):
+        pesos.append(int(match.group(1)) / 1_000_000)
+        fim = match.end()
+    if not fim and len(buf) >= TAMANHO_QUADRO:
+        # sem quadro: lixo, exceto um possível início de quadro no final
+        fim = len(buf) - (TAMANHO_QUADRO - 1)
+    falhas = 0
+    if fim:
+        falhas = buf.count(b"p`", 0, fim) - len(pesos)
+        del buf[:fim]
+    return pesos, falhas
+
+def extrair_pesos(buf: bytearray) -> List[float]:
+    return extrair_quadros(buf)[0]
+
+def ler_peso(ser: "serial.Serial") -> float:
     """
     Envia comando ENQ e lê resposta da balança.
     Extrai e retorna peso em kg. Retorna 0.0 em caso de falha.
     """
     try:
-        ser.write(b'\x05')  # ENQ
+        ser.write(ENQ)
         time.sleep(READ_SLEEP)
 
-        resposta = ser.read(READ_BYTES).decode('ascii', errors='ignore').strip()
+        resposta = ser.read(READ_BYTES)
         logger.debug(f"[TC420] Resposta crua: {resposta!r}")
 
         # Exemplo de resposta esperada: p`000030000000
-        match = re.search(r"p`(\d{12})", resposta)
-        if match:
-            peso = int(match.group(1)) / 1_000_000
+        pesos = extrair_pesos(bytearray(resposta))
+        if pesos:
+            peso = pesos[-1]
             logger.info(f"[TC420] Peso lido: {peso} kg")
             return peso
 
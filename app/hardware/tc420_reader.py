@@ -0,0 +1,419 @@
+import json
+import time
+import socket
+import logging
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Iterator, Optional, Tuple, NamedTuple
+
+from app.config import Config
+from app.hardware.serial_connection import abrir_porta, extrair_quadros, ENQ, SERIAL_PORT
+
+logger = logging.getLogger(__name__)
+
+
+class Leitura(NamedTuple):
+    """Última leitura publicada pelo leitor; imutável, trocada numa única atribuição."""
+    peso: float
+    estavel: bool
+    instante: float   # time.time() do quadro
+    seq: int          # incrementa a cada quadro recebido
+
+    def idade(self) -> float:
+        return time.time() - self.instante
+
+    def recente(self) -> bool:
+        """Quadro dentro de TC420_VALIDADE_S; depois disso a balança conta como sem leitura."""
+        return self.idade() <= Config.TC420_VALIDADE_S
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "peso": self.peso,
+            "estavel": self.estavel,
+            "instante": self.instante,
+            "seq": self.seq,
+        }
+
+
+class DetectorEstabilidade:
+    """
+    Janela deslizante de (t, peso). A leitura é estável quando as amostras dos
+    últimos `permanencia_s` segundos ficam todas dentro de `tolerancia_kg`.
+    """
+
+    def __init__(self,
+                 janela_s: float = Config.TC420_JANELA_S,
+                 tolerancia_kg: float = Config.TC420_TOLERANCIA_KG,
+                 permanencia_s: float = Config.TC420_PERMANENCIA_S):
+        self.janela_s = max(janela_s, permanencia_s)
+        self.tolerancia_kg = tolerancia_kg
+        self.permanencia_s = permanencia_s
+        self._amostras: Deque[Tuple[float, float]] = deque()
+
+    def adicionar(self, t: float, peso: float) -> bool:
+        amostras = self._amostras
+        amostras.append((t, peso))
+        while amostras and t - amostras[0][0] > self.janela_s:
+            amostras.popleft()
+
+        # recua a partir da amostra mais nova enquanto a faixa [min, max] couber na tolerância
+        menor = maior = peso
+        desde = t
+        for ti, pi in reversed(amostras):
+            menor, maior = min(menor, pi), max(maior, pi)
+            if maior - menor > self.tolerancia_kg:
+                break
+            desde = ti
+        return t - desde >= self.permanencia_s
+
+    def limpar(self) -> None:
+        self._amostras.clear()
+
+
+class SaudeLeitor:
+    """Contadores de saúde de uma balança (lidos sem lock; só a thread do leitor escreve)."""
+
+    def __init__(self):
+        self.quadros = 0
+        self.falhas_parse = 0
+        self.reconexoes = 0
+        self.conectado = False
+        self.ultimo_erro: Optional[str] = None
+        self.proxima_tentativa_em: Optional[float] = None   # time.time() do próximo open
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(vars(self))
+
+
+class _FonteLeituras:
+    """
+    Última leitura de uma balança com espera por quadros novos. Uma thread em
+    background (`_executar`, nas subclasses) publica as leituras; as rotas só
+    consultam.
+    """
+
+    _PREFIXO_THREAD = "balanca"
+
+    def __init__(self, id_balanca: str, porta: str):
+        self.id_balanca = id_balanca
+        self.porta = porta
+        self.saude = SaudeLeitor()
+        self._cond = threading.Condition()
+        self._parar = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._leitura: Optional[Leitura] = None
+
+    # ------------------ Ciclo de vida ------------------
+    def iniciar(self):
+        with self._cond:
+            if self._thread is None or not self._thread.is_alive():
+                self._parar.clear()
+                self._thread = threading.Thread(target=self._executar, name=f"{self._PREFIXO_THREAD}-{self.id_balanca}", daemon=True)
+                self._thread.start()
+        return self
+
+    def parar(self) -> None:
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+
+    @property
+    def ativo(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _executar(self) -> None:
+        raise NotImplementedError
+
+    # ------------------ Consulta ------------------
+    def atual(self) -> Optional[Leitura]:
+        """Última leitura, ou None se não houver quadro recente (TC420_VALIDADE_S)."""
+        leitura = self._leitura
+        return leitura if leitura is not None and leitura.recente() else None
+
+    def peso_estavel(self) -> Optional[float]:
+        """Peso assentado, sem bloquear; None se a balança ainda oscila ou está sem leitura."""
+        leitura = self.atual()
+        return leitura.peso if leitura is not None and leitura.estavel else None
+
+    def aguardar(self, seq_visto: int = 0, timeout: Optional[float] = None) -> Optional[Leitura]:
+        """
+        Bloqueia até chegar um quadro com seq > `seq_visto` (ou timeout) e devolve a
+        última leitura publicada, mesmo velha: o chamador avança o seq por ela e
+        checa `recente()` à parte, senão voltaria a esperar por um seq já passado.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._leitura is not None and self._leitura.seq > seq_visto, timeout)
+            return self._leitura
+
+    def seq_atual(self) -> int:
+        """Seq da última leitura publicada (0 sem leitura); marca "a partir de agora" para `aguardar_estavel`."""
+        leitura = self._leitura
+        return leitura.seq if leitura is not None else 0
+
+    def aguardar_estavel(self, timeout: float, apos_seq: Optional[int] = None,
+                         carga_min: float = 0.0) -> Optional[Leitura]:
+        """
+        Primeira leitura estável com seq > `apos_seq` (padrão: o seq na chamada) e
+        peso >= `carga_min` dentro de `timeout` segundos. A leitura já estável na
+        entrada não serve: pode ser a plataforma vazia ou o caminhão anterior.
+        """
+        limite = time.monotonic() + timeout
+        seq = self.seq_atual() if apos_seq is None else apos_seq
+        while True:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                return None
+            leitura = self.aguardar(seq, restante)
+            if leitura is None or leitura.seq <= seq:
+                continue
+            seq = leitura.seq
+            if leitura.recente() and leitura.estavel and leitura.peso >= carga_min:
+                return leitura
+
+    def acompanhar(self,
+                   base: Optional[Leitura] = None,
+                   intervalo_min: float = 0.0,
+                   heartbeat_s: float = Config.BALANCA_STREAM_HEARTBEAT_S) -> Iterator[Tuple[str, Optional[Leitura]]]:
+        """
+        Gera só as mudanças em relação ao último valor entregue (a partir de `base`):
+        ("leitura", Leitura) quando peso ou estabilidade mudam, ("sem_leitura", None)
+        quando a balança para de responder e ("ping", None) após `heartbeat_s` sem
+        novidades. Entre dois eventos espera ao menos `intervalo_min`, entregando o
+        valor mais recente (as leituras intermediárias são descartadas).
+        """
+        seq = base.seq if base else 0
+        enviado = (base.peso, base.estavel) if base else None
+        proximo = 0.0
+        ultimo_evento = time.monotonic()
+        ultima = self._leitura
+        while True:
+            espera = proximo - time.monotonic()
+            if espera > 0:
+                time.sleep(espera)
+            timeout = heartbeat_s
+            if enviado is not None and ultima is not None:
+                # acorda quando a última leitura vencer, para avisar "sem_leitura" a tempo
+                validade = Config.TC420_VALIDADE_S - ultima.idade()
+                timeout = min(timeout, max(validade, 0.01))
+            ultima = self.aguardar(seq, timeout)
+            agora = time.monotonic()
+            if ultima is not None:
+                seq = ultima.seq
+            leitura = ultima if ultima is not None and ultima.recente() else None
+            chave = None if leitura is None else (leitura.peso, leitura.estavel)
+            if chave != enviado:
+                enviado = chave
+                ultimo_evento = agora
+                proximo = agora + intervalo_min
+                yield ("sem_leitura", None) if leitura is None else ("leitura", leitura)
+            elif agora - ultimo_evento >= heartbeat_s:
+                ultimo_evento = agora
+                yield "ping", None
+
+
+
+class LeitorTC420(_FonteLeituras):
+    """
+    Mantém a porta da TC420 aberta numa thread em background: envia ENQ a cada
+    TC420_INTERVALO_ENQ, acumula os bytes num ring buffer, extrai os quadros `p``
+    e publica a leitura mais recente com o flag de estabilidade. As rotas consultam
+    `atual()` sem tocar na serial.
+
+    Reconexão: uma tentativa de abrir por vez, com backoff exponencial
+    (TC420_RECONEXAO_S até TC420_RECONEXAO_MAX_S) esperado dentro da própria
+    thread; enquanto isso as consultas devolvem None imediatamente.
+    """
+
+    _PREFIXO_THREAD = "tc420"
+
+    def __init__(self, id_balanca: str = "principal", porta: str = SERIAL_PORT):
+        super().__init__(id_balanca, porta)
+        self._detector = DetectorEstabilidade()
+        self._buf = bytearray()
+
+    def _abrir(self, espera: float):
+        """Tenta abrir a porta uma vez; em falha agenda a próxima tentativa e devolve None."""
+        try:
+            # leituras curtas: a thread volta logo para checar ENQ/parada
+            ser = abrir_porta(self.porta, timeout=min(Config.TC420_INTERVALO_ENQ, 0.05))
+        except Exception as e:
+            self.saude.ultimo_erro = str(e)
+            self.saude.proxima_tentativa_em = time.time() + espera
+            logger.error(f"[TC420:{self.id_balanca}] Sem conexão em {self.porta}: {e} (nova tentativa em {espera:.1f}s)")
+            return None
+        self._buf.clear()
+        self._detector.limpar()
+        self.saude.conectado = True
+        self.saude.proxima_tentativa_em = None
+        logger.info(f"[TC420:{self.id_balanca}] Conectado na porta {self.porta}")
+        return ser
+
+    def _executar(self) -> None:
+        ser = None
+        espera = Config.TC420_RECONEXAO_S
+        primeira = True
+        while not self._parar.is_set():
+            if ser is None:
+                ser = self._abrir(espera)
+                if ser is None:
+                    self._parar.wait(espera)
+                    espera = min(espera * 2, Config.TC420_RECONEXAO_MAX_S)
+                    continue
+                if not primeira:
+                    self.saude.reconexoes += 1
+                primeira = False
+                espera = Config.TC420_RECONEXAO_S
+            try:
+                self._ciclo(ser)
+            except Exception as e:
+                logger.warning(f"[TC420:{self.id_balanca}] Conexão perdida em {self.porta}: {e}")
+                self.saude.conectado = False
+                self.saude.ultimo_erro = str(e)
+                try:
+                    ser.close()
+                except Exception:
+                    pass
+                ser = None
+        if ser is not None:
+            ser.close()
+        self.saude.conectado = False
+
+    def _ciclo(self, ser) -> None:
+        ser.write(ENQ)
+        limite = time.monotonic() + Config.TC420_INTERVALO_ENQ
+        while time.monotonic() < limite and not self._parar.is_set():
+            dados = ser.read(max(1, ser.in_waiting))
+            if dados:
+                self._alimentar(dados)
+
+    def _alimentar(self, dados: bytes) -> None:
+        """Acrescenta bytes ao ring buffer e publica cada quadro completo encontrado."""
+        self._buf += dados
+        excesso = len(self._buf) - Config.TC420_BUFFER_BYTES
+        if excesso > 0:
+            del self._buf[:excesso]
+        pesos, falhas = extrair_quadros(self._buf)
+        self.saude.falhas_parse += falhas
+        for peso in pesos:
+            self._publicar(peso)
+
+    def _publicar(self, peso: float) -> None:
+        estavel = self._detector.adicionar(time.monotonic(), peso)
+        self.saude.quadros += 1
+        with self._cond:
+            seq = self._leitura.seq + 1 if self._leitura else 1
+            self._leitura = Leitura(peso, estavel, time.time(), seq)
+            self._cond.notify_all()
+
+
+class LeitorRemoto(_FonteLeituras):
+    """
+    Mesma interface do LeitorTC420, sem abrir a serial: assina a balança no
+    processo dono das portas (app.hardware.tc420_servidor) por socket unix
+    (BALANCA_SOCKET) e republica cada leitura recebida. Usado nos workers com
+    BALANCA_LEITOR=processo; o seq é o do leitor único, igual em todos os workers.
+    """
+
+    _PREFIXO_THREAD = "balanca-remota"
+
+    def __init__(self, id_balanca: str, porta: str, caminho: str = Config.BALANCA_SOCKET):
+        super().__init__(id_balanca, porta)
+        self.caminho = caminho
+
+    def _executar(self) -> None:
+        espera = Config.TC420_RECONEXAO_S
+        while not self._parar.is_set():
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                    # o servidor manda ao menos a saúde a cada segundo; silêncio maior = servidor travado
+                    sock.settimeout(max(Config.TC420_VALIDADE_S, 5.0))
+                    sock.connect(self.caminho)
+                    sock.sendall(f"{self.id_balanca}\n".encode())
+                    espera = Config.TC420_RECONEXAO_S
+                    for linha in sock.makefile("rb"):
+                        if self._parar.is_set():
+                            break
+                        self._receber(json.loads(linha))
+                if self._parar.is_set():
+                    break
+                raise ConnectionError("servidor de balanças encerrou a conexão")
+            except (OSError, ValueError, TypeError) as e:
+                self.saude.conectado = False
+                self.saude.ultimo_erro = f"servidor de balanças ({self.caminho}): {e}"
+                self.saude.proxima_tentativa_em = time.time() + espera
+                logger.warning(f"[TC420:{self.id_balanca}] {self.saude.ultimo_erro} (nova tentativa em {espera:.1f}s)")
+            self._parar.wait(espera)
+            espera = min(espera * 2, Config.TC420_RECONEXAO_MAX_S)
+
+    def _receber(self, msg: Dict[str, Any]) -> None:
+        vars(self.saude).update(msg.get("saude") or {})
+        dados = msg.get("leitura")
+        if dados is None:
+            return
+        leitura = Leitura(**dados)
+        with self._cond:
+            if self._leitura is None or leitura.seq != self._leitura.seq:
+                self._leitura = leitura
+                self._cond.notify_all()
+
+
+# ------------------ Registro de balanças ------------------
+class RegistroBalancas:
+    """
+    Um leitor por balança (Config.BALANCAS: id -> porta), criado e iniciado no
+    primeiro uso. Cada leitor tem a própria thread e conexão, então uma
+    reconexão travada na balança de entrada não afeta a de saída.
+
+    BALANCA_LEITOR=local abre a serial no próprio processo (LeitorTC420; um
+    único processo). Com BALANCA_LEITOR=processo só o tc420_servidor abre as
+    portas e os workers usam LeitorRemoto: dois workers na mesma porta
+    intercalariam ENQs e rasgariam os quadros um do outro.
+    """
+
+    def __init__(self, portas: Optional[Dict[str, str]] = None, modo: str = Config.BALANCA_LEITOR):
+        self.portas = dict(portas if portas is not None else Config.BALANCAS)
+        self._classe = LeitorRemoto if modo == "processo" else LeitorTC420
+        self._lock = threading.Lock()
+        self._leitores: Dict[str, _FonteLeituras] = {}
+
+    def ids(self):
+        return list(self.portas)
+
+    def get(self, id_balanca: Optional[str] = None) -> _FonteLeituras:
+        """Leitor da balança `id_balanca` (padrão: a primeira). KeyError se o id não existir."""
+        id_balanca = id_balanca or next(iter(self.portas))
+        leitor = self._leitores.get(id_balanca)
+        if leitor is None:
+            porta = self.portas[id_balanca]
+            with self._lock:
+                leitor = self._leitores.get(id_balanca)
+                if leitor is None:
+                    leitor = self._leitores[id_balanca] = self._classe(id_balanca, porta)
+        return leitor.iniciar()
+
+    def saude(self) -> Dict[str, Dict[str, Any]]:
+        """Contadores por balança; as que ainda não foram usadas aparecem como não iniciadas."""
+        out = {}
+        for id_balanca, porta in self.portas.items():
+            leitor = self._leitores.get(id_balanca)
+            info = {"porta": porta, "iniciado": leitor is not None and leitor.ativo}
+            if leitor is not None:
+                info.update(leitor.saude.to_dict())
+                leitura = leitor.atual()
+                info["leitura"] = leitura.to_dict() if leitura is not None else None
+            out[id_balanca] = info
+        return out
+
+
+# Singleton do registro (um por processo)
+_REGISTRO = None
+_REGISTRO_LOCK = threading.Lock()
+def get_registro() -> RegistroBalancas:
+    global _REGISTRO
+    with _REGISTRO_LOCK:
+        if _REGISTRO is None:
+            _REGISTRO = RegistroBalancas()
+        return _REGISTRO
+
+def get_leitor(id_balanca: Optional[str] = None) -> _FonteLeituras:
+    return get_registro().get(id_balanca)
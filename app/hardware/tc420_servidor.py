@@ -0,0 +1,96 @@
+"""
+Processo dono das portas seriais das balanças (BALANCA_LEITOR=processo).
+
+Roda um LeitorTC420 por balança e repassa cada leitura, e a saúde do leitor
+a cada segundo, aos workers inscritos no socket unix BALANCA_SOCKET
+(LeitorRemoto). O master do gunicorn inicia este processo (gunicorn.conf.py);
+à mão:
+
+    python -m app.hardware.tc420_servidor
+"""
+import os
+import json
+import socket
+import logging
+import threading
+from typing import Dict, List, Optional
+
+from app.config import Config
+from app.hardware.tc420_reader import LeitorTC420
+
+# assinante que não consome em 1 s (worker travado) é desconectado
+ENVIO_TIMEOUT_S = 1.0
+
+logger = logging.getLogger(__name__)
+
+
+class ServidorBalancas:
+    """Uma linha JSON por leitura: {"leitura": {...} | null, "saude": {...}}."""
+
+    def __init__(self, caminho: str = Config.BALANCA_SOCKET, portas: Optional[Dict[str, str]] = None):
+        self.caminho = caminho
+        self.portas = dict(portas if portas is not None else Config.BALANCAS)
+        self._leitores: Dict[str, LeitorTC420] = {}
+        self._assinantes: Dict[str, List[socket.socket]] = {id_balanca: [] for id_balanca in self.portas}
+        self._lock = threading.Lock()
+
+    def executar(self) -> None:
+        for id_balanca, porta in self.portas.items():
+            self._leitores[id_balanca] = LeitorTC420(id_balanca, porta).iniciar()
+            threading.Thread(target=self._repassar, args=(id_balanca,),
+                             name=f"tc420-repasse-{id_balanca}", daemon=True).start()
+
+        if os.path.exists(self.caminho):
+            os.unlink(self.caminho)   # socket de uma execução anterior
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as servidor:
+            servidor.bind(self.caminho)
+            servidor.listen()
+            logger.info(f"[TC420] Servidor de balanças em {self.caminho}: {', '.join(self.portas)}")
+            while True:
+                conn, _ = servidor.accept()
+                threading.Thread(target=self._inscrever, args=(conn,), daemon=True).start()
+
+    def _inscrever(self, conn: socket.socket) -> None:
+        """A primeira linha enviada pelo worker é o id da balança assinada."""
+        try:
+            conn.settimeout(ENVIO_TIMEOUT_S)
+            id_balanca = conn.makefile("rb").readline().decode().strip()
+        except (OSError, UnicodeDecodeError):
+            conn.close()
+            return
+        if id_balanca not in self._assinantes:
+            logger.warning(f"[TC420] Assinatura de balança desconhecida: {id_balanca!r}")
+            conn.close()
+            return
+        with self._lock:
+            self._assinantes[id_balanca].append(conn)
+
+    def _repassar(self, id_balanca: str) -> None:
+        leitor = self._leitores[id_balanca]
+        seq = 0
+        while True:
+            # acorda a cada quadro novo ou, sem quadros, a cada segundo (saúde)
+            leitura = leitor.aguardar(seq, 1.0)
+            if leitura is not None:
+                seq = leitura.seq
+            linha = json.dumps({
+                "leitura": leitura.to_dict() if leitura is not None else None,
+                "saude": leitor.saude.to_dict(),
+            }).encode() + b"\n"
+            self._enviar(id_balanca, linha)
+
+    def _enviar(self, id_balanca: str, linha: bytes) -> None:
+        with self._lock:
+            assinantes = list(self._assinantes[id_balanca])
+        for conn in assinantes:
+            try:
+                conn.sendall(linha)
+            except OSError:
+                with self._lock:
+                    self._assinantes[id_balanca].remove(conn)
+                conn.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    ServidorBalancas().executar()
@@ -5,7 +5,10 @@ from flask_migrate import Migrate
 from app.database import db
 from app.config import get_config
 from app.routes import register_blueprints
+from app.utils.model_loader import iniciar_aquecimento, aquecer_modelos, estado_modelos
+from app.utils.memory_report import relatorio_memoria
 import os
+import gc
 import logging
 from logging.handlers import RotatingFileHandler
 
@@ -34,17 +37,26 @@ def create_app(config_name=None):
     setup_logging(app)
     setup_app_directories(app)
 
+    setup_models()
+    setup_commands(app)
+
     from sqlalchemy import text
 
     @app.route('/health')
     def health_check():
+        # o estado dos modelos é informativo: carregando ainda é "healthy" para o liveness
+        modelos = estado_modelos()
         try:
             db.session.execute(text('SELECT 1'))
-            return {'status': 'healthy', 'database': 'connected'}, 200
+            return {'status': 'healthy', 'database': 'connected', 'modelos': modelos}, 200
         except Exception as e:
             app.logger.error(f"Health check failed: {e}")
-            return {'status': 'unhealthy', 'error': str(e)}, 500
+            return {'status': 'unhealthy', 'error': str(e), 'modelos': modelos}, 500
+
 
+    @app.route('/health/memoria')
+    def health_memoria():
+        return {'memoria': relatorio_memoria(), 'modelos': estado_modelos()}, 200
 
     @app.route('/')
     def index():
@@ -61,6 +73,7 @@ def create_app(config_name=None):
                 'saida': '/api/balanca/saida',
                 'historico': '/api/balanca/historico',
                 'ciclos_abertos': '/api/balanca/ciclos-abertos',
+                'agregados': '/api/balanca/agregados',
                 'health_check': '/health'
             }
         }
@@ -88,6 +101,48 @@ def setup_logging(app):
         app.logger.info('Sistema de motoristas iniciado')
 
 
+def setup_models():
+    # MODELS_PRELOAD: carga síncrona dentro do create_app. Com `preload_app` do
+    # gunicorn isso roda no master, antes do fork, e os workers compartilham os
+    # pesos (somente leitura) por copy-on-write. Nada de inferência aqui: threads
+    # do torch criadas antes do fork não sobrevivem nos filhos.
+    if os.getenv('MODELS_PRELOAD', 'false').lower() == 'true':
+        aquecer_modelos()
+        # congela os objetos atuais fora do GC para que as varreduras nos
+        # workers não escrevam nos cabeçalhos e quebrem o compartilhamento
+        gc.freeze()
+    # MODELS_WARMUP: aquecimento em background; o worker responde /health
+    # imediatamente e o 1º reconhecimento não paga a carga. Sob preload do
+    # gunicorn a thread só pode nascer depois do fork (post_worker_init).
+    elif aquecimento_em_background() and os.getenv('MODELS_WARMUP_POS_FORK', 'false').lower() != 'true':
+        iniciar_aquecimento()
+
+
+def aquecimento_em_background():
+    return (os.getenv('MODELS_WARMUP', 'false').lower() == 'true'
+            and os.getenv('MODELS_PRELOAD', 'false').lower() != 'true')
+
+
+def setup_commands(app):
+    import click
+    from datetime import date
+
+    def _data(valor):
+        return date.fromisoformat(valor) if valor else None
+
+    @app.cli.command('recalcular-agregados')
+    @click.option('--de', 'inicio', help='primeiro dia (AAAA-MM-DD) a recalcular')
+    @click.option('--ate', 'fim', help='último dia (AAAA-MM-DD) a recalcular')
+    def recalcular_agregados_cmd(inicio, fim):
+        """Reconstrói tb_agregados_pesagem a partir de ciclos_pesagem."""
+        from app.services.agregados_service import recalcular_agregados
+        try:
+            total = recalcular_agregados(_data(inicio), _data(fim))
+        except ValueError as e:
+            raise click.UsageError(str(e))
+        click.echo(f'{total} linhas de agregados gravadas')
+
+
 def setup_app_directories(app):
     directories = [
         app.config.get('UPLOAD_FOLDER', 'uploads'),
@@ -3,3 +3,4 @@ from .caminhao import Caminhao
 from .ciclo_pesagem import CicloPesagem
 from .pesagem import Pesagem
 from .reconhecimento import RegistroReconhecimento
+from .agregado_pesagem import AgregadoPesagem, AgregadoCaminhao
@@ -0,0 +1,38 @@
+from app.database import db
+
+class AgregadoPesagem(db.Model):
+    """
+    Totais diários de ciclos fechados, mantidos incrementalmente em `registrar_saida`.
+    Uma linha por (dia, dimensao, chave):
+      - dimensao 'dia':       chave ''              (total do dia)
+      - dimensao 'empresa':   chave Caminhao.empresa
+      - dimensao 'motorista': chave id_motorista
+      - dimensao 'hora':      chave hora da saída ('00'..'23')
+    """
+    __tablename__ = 'tb_agregados_pesagem'
+    __table_args__ = (
+        db.UniqueConstraint('dia', 'dimensao', 'chave', name='uq_agregados_pesagem_dia_dimensao_chave'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    dia = db.Column(db.Date, nullable=False)
+    dimensao = db.Column(db.String(16), nullable=False)
+    chave = db.Column(db.Text, nullable=False, default='')
+    ciclos = db.Column(db.Integer, nullable=False, default=0)           # ciclos fechados
+    caminhoes = db.Column(db.Integer, nullable=False, default=0)        # caminhões distintos (AgregadoCaminhao)
+    peso_liquido_total = db.Column(db.Float, nullable=False, default=0.0)
+    peso_liquido_n = db.Column(db.Integer, nullable=False, default=0)   # ciclos com peso_liquido (para a média)
+
+
+class AgregadoCaminhao(db.Model):
+    """
+    Caminhões já contados em cada linha de AgregadoPesagem. O incremento só soma
+    1 em `caminhoes` quando o INSERT aqui de fato insere (ON CONFLICT DO NOTHING),
+    então o mesmo caminhão em vários ciclos do dia conta uma vez.
+    """
+    __tablename__ = 'tb_agregados_caminhoes'
+
+    dia = db.Column(db.Date, primary_key=True)
+    dimensao = db.Column(db.String(16), primary_key=True)
+    chave = db.Column(db.Text, primary_key=True)
+    caminhao_id = db.Column(db.Integer, primary_key=True)
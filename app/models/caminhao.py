@@ -2,6 +2,10 @@ from app.database import db
 
 class Caminhao(db.Model):
     __tablename__ = 'tb_caminhoes'
+    __table_args__ = (
+        # busca por placa normalizada: func.upper(Caminhao.placa) == ...
+        db.Index('ix_tb_caminhoes_placa_upper', db.text('upper(placa)')),
+    )
 
     id_caminhao = db.Column(db.Integer, primary_key=True)
     placa = db.Column(db.String(15), nullable=False)
@@ -2,12 +2,19 @@ from app.database import db
 
 class CicloPesagem(db.Model):
     __tablename__ = 'ciclos_pesagem'
+    __table_args__ = (
+        # ciclos em aberto (data_saida IS NULL): portaria e /ciclos-abertos
+        db.Index('ix_ciclos_pesagem_abertos', 'caminhao_id',
+                 postgresql_where=db.text('data_saida IS NULL')),
+        db.Index('ix_ciclos_pesagem_caminhao_id', 'caminhao_id', 'id_pesagem'),
+        db.Index('ix_ciclos_pesagem_data_entrada', 'data_entrada'),
+    )
 
     id_pesagem = db.Column(db.Integer, primary_key=True)
     caminhao_id = db.Column(db.Integer, db.ForeignKey('tb_caminhoes.id_caminhao'), nullable=False)
     motorista_id = db.Column(db.Integer, db.ForeignKey('tb_motoristas.id_motorista'), nullable=False)
-    data_entrada = db.Column(db.Time, nullable=True)
+    data_entrada = db.Column(db.DateTime(timezone=True), nullable=True)
     peso_entrada = db.Column(db.Float, nullable=True)
-    data_saida = db.Column(db.Time, nullable=True)
+    data_saida = db.Column(db.DateTime(timezone=True), nullable=True)
     peso_saida = db.Column(db.Float, nullable=True)
     peso_liquido = db.Column(db.Float, nullable=True)
@@ -1,15 +1,26 @@
+from datetime import datetime, timezone
+
 from app.database import db
 import numpy as np
 from typing import Optional
 
 class Motorista(db.Model):
     __tablename__ = 'tb_motoristas'
+    __table_args__ = (
+        # unicidade no cadastro: CPF só com dígitos e CNH
+        db.Index('ix_tb_motoristas_cpf_digitos', db.text("replace(replace(cpf, '.', ''), '-', '')")),
+        db.Index('ix_tb_motoristas_cnh', 'cnh'),
+    )
 
     id_motorista = db.Column(db.Integer, primary_key=True)
     cnh = db.Column(db.String(20), nullable=False)
     cpf = db.Column(db.String(14), nullable=False)
     nome = db.Column(db.Text, nullable=False)
-    biometria = db.Column(db.LargeBinary, nullable=True)  # bytes: 512 (f32) ou 1024 (f64)
+    biometria = db.Column(db.LargeBinary, nullable=True)  # bytes: 512 (f32) ou 1024 (f64); centróide se houver templates
+    biometria_templates = db.Column(db.LargeBinary, nullable=True)  # M x 512 bytes (f32), templates concatenados
+    raio_biometria = db.Column(db.Float, nullable=True)  # maior distância template -> centróide
+    # carimbo da última alteração biométrica; a galeria de cada worker relê as linhas mais novas
+    biometria_atualizada_em = db.Column(db.DateTime(timezone=True), nullable=True, index=True)
 
     def set_biometria(self, encoding: np.ndarray, dtype: str = "float32") -> None:
         """
@@ -22,6 +33,9 @@ class Motorista(db.Model):
             raise ValueError("dtype deve ser 'float32' ou 'float64'")
         arr = arr.astype(np.float32 if dtype == "float32" else np.float64, copy=False)
         self.biometria = arr.tobytes()
+        # Carimbo do lado do Python (funciona em Postgres e SQLite); commits fora de
+        # ordem ficam cobertos pela sobreposição FACE_GALERIA_MARGEM_S da galeria.
+        self.biometria_atualizada_em = datetime.now(timezone.utc)
 
     def get_biometria(self) -> Optional[np.ndarray]:
         """
@@ -39,3 +53,32 @@ class Motorista(db.Model):
             # dado inválido/corrompido
             return None
         return arr  # shape (128,)
+
+    def set_templates(self, encodings) -> None:
+        """
+        Salva M encodings (M,128) como float32 concatenados (M*512 bytes), no mesmo
+        layout de `set_biometria`. `biometria` passa a guardar o centróide e
+        `raio_biometria` a maior distância de um template até ele.
+        """
+        arr = np.asarray(encodings, dtype=np.float32)
+        if arr.ndim == 1:
+            arr = arr.reshape(1, -1)
+        if arr.ndim != 2 or arr.shape[0] == 0 or arr.shape[1] != 128:
+            raise ValueError("Templates faciais devem ter shape (M, 128)")
+        centroide = arr.mean(axis=0)
+        self.set_biometria(centroide)
+        self.biometria_templates = np.ascontiguousarray(arr).tobytes()
+        self.raio_biometria = float(np.linalg.norm(arr - centroide, axis=1).max())
+
+    def get_templates(self) -> Optional[np.ndarray]:
+        """
+        Retorna np.ndarray (M,128) float32. Cadastros antigos, sem templates,
+        devolvem a própria `biometria` como template único.
+        """
+        if self.biometria_templates:
+            buf = memoryview(self.biometria_templates)
+            if len(buf) % (128 * 4) == 0:
+                return np.frombuffer(buf, dtype=np.float32).reshape(-1, 128)
+            return None
+        arr = self.get_biometria()
+        return None if arr is None else arr.astype(np.float32).reshape(1, 128)
@@ -1,28 +1,149 @@
-from flask import Blueprint, request, jsonify
+import json
+import threading
+from datetime import date, datetime
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from werkzeug.datastructures import FileStorage
+from app.config import Config
 from app.services.balanca_service import (
     registrar_entrada,
     registrar_saida,
     get_motoristas,
     get_ciclos_abertos,
-    get_historico
+    get_historico,
+    exportar_ciclos
 )
+from app.hardware.tc420_reader import get_leitor, get_registro, Leitura
+from app.services.portaria_service import processar_passagem, PortariaErro
+from app.services.agregados_service import get_agregados
+from app.utils.image_io import decodificar_upload
 
 balanca_bp = Blueprint('balanca', __name__)
 
+HISTORICO_LIMITE_PADRAO = 50
+HISTORICO_LIMITE_MAX = 500
+
+# cada stream/long-poll prende uma thread do worker até o cliente sair; acima do
+# limite responde 503, para não deixar o resto da API sem threads
+_streams = threading.BoundedSemaphore(Config.BALANCA_STREAM_MAX_CLIENTES)
+
+def _is_image(fs: FileStorage) -> bool:
+    mt = (fs.mimetype or "") if fs else ""
+    fn = (fs.filename or "") if fs else ""
+    return bool(fs and fn and mt.startswith("image/"))
+
+def _leitor(id_balanca=None):
+    """Leitor da balança pedida (`?balanca=<id>`); None se o id não estiver em BALANCAS."""
+    try:
+        return get_leitor(id_balanca or request.args.get('balanca'))
+    except KeyError:
+        return None
+
+def _peso_informado_ou_estavel(data, id_padrao):
+    """Peso do corpo da requisição; se ausente, a leitura assentada da TC420 (sem bloquear)."""
+    if data.get('peso'):
+        return data['peso']
+    leitor = _leitor(data.get('balanca') or id_padrao)
+    return leitor.peso_estavel() if leitor is not None else None
+
+@balanca_bp.route('/peso', methods=['GET'])
+def peso_atual():
+    leitor = _leitor()
+    if leitor is None:
+        return jsonify({'error': 'balança desconhecida'}), 404
+    leitura = leitor.atual()
+    if leitura is None:
+        return jsonify({'error': 'sem leitura recente da balança'}), 503
+    return jsonify(leitura.to_dict()), 200
+
+@balanca_bp.route('/saude', methods=['GET'])
+def saude_balancas():
+    # contadores por balança: quadros, falhas de parse, reconexões, estado da conexão
+    return jsonify(get_registro().saude()), 200
+
 @balanca_bp.route('/motoristas', methods=['GET'])
 def listar_motoristas():
     rows = get_motoristas()
     return jsonify([{'id': r[0], 'nome': r[1]} for r in rows]), 200
 
+def _evento_sse(evento, leitura):
+    if leitura is None:
+        # comentário SSE: mantém a conexão viva atrás de proxies
+        return ": ping\n\n" if evento == "ping" else f"event: {evento}\ndata: {{}}\n\n"
+    return f"id: {leitura.seq}\nevent: {evento}\ndata: {json.dumps(leitura.to_dict())}\n\n"
+
+@balanca_bp.route('/peso/stream', methods=['GET'])
+def peso_stream():
+    """
+    Leituras da TC420 (`?balanca=<id>`) para várias telas sobre a mesma conexão
+    serial (um único leitor por balança). Envia só mudanças de peso/estabilidade, no máximo
+    BALANCA_STREAM_MAX_HZ eventos/s (parâmetro `max_hz` > 0 pode reduzir). Cada worker
+    atende até BALANCA_STREAM_MAX_CLIENTES streams ao mesmo tempo; acima disso, 503.
+
+    - SSE (padrão): text/event-stream com eventos `leitura` e `sem_leitura`.
+    - Long-poll (`modo=poll`): o cliente reenvia `seq`, `peso` e `estavel` da última
+      resposta; devolve a próxima mudança (200) ou 204 após BALANCA_POLL_TIMEOUT_S.
+    """
+    leitor = _leitor()
+    if leitor is None:
+        return jsonify({'error': 'balança desconhecida'}), 404
+    max_hz = request.args.get('max_hz', Config.BALANCA_STREAM_MAX_HZ, type=float)
+    if max_hz is None or not max_hz > 0:
+        return jsonify({'error': 'max_hz deve ser um número maior que zero'}), 400
+    # o cliente só pode reduzir a taxa; sem limite no servidor (<= 0) não há intervalo
+    max_hz = min(max_hz, Config.BALANCA_STREAM_MAX_HZ) if Config.BALANCA_STREAM_MAX_HZ > 0 else max_hz
+    intervalo_min = 1.0 / max_hz
+
+    if not _streams.acquire(blocking=False):
+        resp = jsonify({'error': 'limite de streams da balança neste worker; tente novamente'})
+        resp.headers['Retry-After'] = str(int(Config.TC420_RECONEXAO_S) or 1)
+        return resp, 503
+
+    if request.args.get('modo') == 'poll':
+        base = None
+        if request.args.get('seq') is not None:
+            base = Leitura(
+                peso=request.args.get('peso', type=float),
+                estavel=request.args.get('estavel', 'false').lower() == 'true',
+                instante=0.0,
+                seq=request.args.get('seq', 0, type=int),
+            )
+        timeout = Config.BALANCA_POLL_TIMEOUT_S
+        try:
+            for evento, leitura in leitor.acompanhar(base, heartbeat_s=timeout):
+                if evento == "leitura":
+                    return jsonify(leitura.to_dict()), 200
+                if evento == "sem_leitura":
+                    return jsonify({'error': 'sem leitura recente da balança'}), 503
+                return '', 204
+        finally:
+            _streams.release()
+
+    def gerar():
+        yield f"retry: {int(Config.TC420_RECONEXAO_S * 1000)}\n\n"
+        for evento, leitura in leitor.acompanhar(intervalo_min=intervalo_min):
+            yield _evento_sse(evento, leitura)
+
+    resp = Response(gerar(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # nginx/render: não bufferizar o stream
+    })
+    # libera a vaga quando o servidor fecha a resposta (cliente desconectou)
+    resp.call_on_close(_streams.release)
+    return resp
+
 @balanca_bp.route('/entrada', methods=['POST'])
 def entrada():
     data = request.get_json(force=True)
-    for campo in ('placa', 'motorista_id', 'peso'):
+    for campo in ('placa', 'motorista_id'):
         if not data.get(campo):
             return jsonify({'error': f'{campo} é obrigatório'}), 400
 
+    peso = _peso_informado_ou_estavel(data, Config.BALANCA_ENTRADA)
+    if peso is None:
+        return jsonify({'error': 'peso não informado e balança não estabilizada'}), 409
+
     try:
-        evento_id = registrar_entrada(data['placa'], data['motorista_id'], data['peso'])
+        evento_id = registrar_entrada(data['placa'], data['motorista_id'], peso)
         return jsonify({'id_evento': evento_id}), 201
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -30,16 +151,50 @@ def entrada():
 @balanca_bp.route('/saida', methods=['POST'])
 def saida():
     data = request.get_json(force=True)
-    for campo in ('evento_id', 'peso'):
-        if not data.get(campo):
-            return jsonify({'error': f'{campo} é obrigatório'}), 400
+    if not data.get('evento_id'):
+        return jsonify({'error': 'evento_id é obrigatório'}), 400
+
+    peso = _peso_informado_ou_estavel(data, Config.BALANCA_SAIDA)
+    if peso is None:
+        return jsonify({'error': 'peso não informado e balança não estabilizada'}), 409
 
     try:
-        registrar_saida(data['evento_id'], data['peso'])
+        registrar_saida(data['evento_id'], peso)
         return '', 204
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@balanca_bp.route('/portaria', methods=['POST'])
+def portaria():
+    """
+    Passagem automática: imagens do rosto e da placa (multipart) -> reconhecimento,
+    decisão entrada/saída pelo ciclo aberto, primeira leitura estável e registro.
+    """
+    rosto_fs = request.files.get('imagem_rosto')
+    placa_fs = request.files.get('imagem_placa')
+    if not rosto_fs or not placa_fs:
+        return jsonify({'error': 'imagem_rosto e imagem_placa são obrigatórias'}), 400
+    if not _is_image(rosto_fs) or not _is_image(placa_fs):
+        return jsonify({'error': 'imagem_rosto e imagem_placa devem ser imagens'}), 400
+
+    try:
+        rosto_img = decodificar_upload(rosto_fs)
+        placa_img = decodificar_upload(placa_fs)
+    except ValueError as ve:
+        return jsonify({'error': str(ve)}), 400
+
+    try:
+        resultado = processar_passagem(rosto_img, placa_img, id_balanca=request.form.get('balanca'))
+        return jsonify(resultado), 201
+    except KeyError:
+        return jsonify({'error': 'balança desconhecida'}), 404
+    except PortariaErro as pe:
+        status = {'nao_reconhecido': 422, 'placa_aproximada': 422,
+                  'balanca_instavel': 409, 'conflito': 409}.get(pe.codigo, 400)
+        return jsonify({'error': str(pe), 'codigo': pe.codigo, **pe.detalhes}), status
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @balanca_bp.route('/ciclos-abertos', methods=['GET'])
 def ciclos_abertos():
     try:
@@ -48,9 +203,78 @@ def ciclos_abertos():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _parse_data(nome):
+    """`AAAA-MM-DD` vira date (dia inteiro, `ate` inclusivo); com hora, datetime."""
+    valor = request.args.get(nome)
+    if not valor:
+        return None
+    try:
+        if len(valor) == 10:
+            return date.fromisoformat(valor)
+        return datetime.fromisoformat(valor)
+    except ValueError:
+        raise ValueError(f'{nome} deve estar no formato ISO (AAAA-MM-DD[THH:MM])')
+
+def _filtros_ciclos():
+    """Filtros de ciclo vindos da query string (histórico e exportação)."""
+    return {
+        'caminhao_id': request.args.get('caminhao_id', type=int),
+        'placa': request.args.get('placa'),
+        'motorista_id': request.args.get('motorista_id', type=int),
+        'inicio': _parse_data('de'),
+        'fim': _parse_data('ate'),
+        'status': request.args.get('status'),
+    }
+
 @balanca_bp.route('/historico', methods=['GET'])
 def historico():
+    limite = min(max(request.args.get('limite', HISTORICO_LIMITE_PADRAO, type=int), 1), HISTORICO_LIMITE_MAX)
+    try:
+        itens, proximo = get_historico(
+            cursor=request.args.get('cursor', type=int),
+            limite=limite,
+            **_filtros_ciclos()
+        )
+        return jsonify({'itens': itens, 'proximo_cursor': proximo}), 200
+    except ValueError as ve:
+        return jsonify({'error': str(ve)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@balanca_bp.route('/exportar', methods=['GET'])
+def exportar():
+    """Exportação streaming dos ciclos (?formato=csv|ndjson, mesmos filtros do histórico)."""
+    formato = (request.args.get('formato') or 'csv').lower()
+    try:
+        filtros = _filtros_ciclos()
+        linhas = exportar_ciclos(formato, **filtros)
+        # valida formato/filtros antes de abrir a resposta (o 1º pedaço não toca o banco no CSV)
+        primeiro = next(linhas, '')
+    except ValueError as ve:
+        return jsonify({'error': str(ve)}), 400
+
+    def gerar():
+        yield primeiro
+        yield from linhas
+
+    mimetype = 'text/csv' if formato == 'csv' else 'application/x-ndjson'
+    nome = f"ciclos_pesagem.{'csv' if formato == 'csv' else 'ndjson'}"
+    return Response(stream_with_context(gerar()), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename={nome}',
+        'X-Accel-Buffering': 'no',
+    })
+
+@balanca_bp.route('/agregados', methods=['GET'])
+def agregados():
+    """Totais diários pré-calculados (?dimensao=dia|empresa|motorista|hora&de=&ate=)."""
     try:
-        return jsonify(get_historico()), 200
+        linhas = get_agregados(
+            dimensao=request.args.get('dimensao', 'dia'),
+            inicio=_parse_data('de'),
+            fim=_parse_data('ate'),
+        )
+        return jsonify(linhas), 200
+    except ValueError as ve:
+        return jsonify({'error': str(ve)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
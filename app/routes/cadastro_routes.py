@@ -1,9 +1,10 @@
 from flask import Blueprint, request, jsonify
 from werkzeug.datastructures import FileStorage
-import os, tempfile, re
+import re
 
-from app.services.cadastro_service import cadastrar_motorista, cadastrar_caminhao
+from app.services.cadastro_service import cadastrar_motorista, cadastrar_caminhao, adicionar_template_motorista
 from app.utils.plate_utils import reconhecer_placa
+from app.utils.image_io import decodificar_upload
 
 cadastro_bp = Blueprint('cadastro', __name__)
 
@@ -17,21 +18,15 @@ def _is_image(fs: FileStorage) -> bool:
     mt = fs.mimetype or ""
     return mt.startswith("image/")
 
-def _as_tempfile(fs: FileStorage, suffix: str = ".jpg") -> str:
-    # Compatível com Windows: fechar o descritor antes de salvar
-    fd, path = tempfile.mkstemp(suffix=suffix)
-    os.close(fd)
-    fs.save(path)
-    return path
-
 def _norm_placa(txt: str) -> str:
     return re.sub(r'[^A-Z0-9]', '', (txt or '').upper())
 
 # ---------- rotas ----------
 @cadastro_bp.route('/motorista', methods=['POST'])
 def route_cadastrar_motorista():
-    img_fs = request.files.get('imagem')
-    if not _is_image(img_fs):
+    # uma ou mais fotos no campo 'imagem' (cada uma vira um template)
+    imgs_fs = request.files.getlist('imagem')
+    if not imgs_fs or not all(_is_image(fs) for fs in imgs_fs):
         return _json_error(400, "bad_request", "Imagem do motorista é obrigatória")
 
     nome = request.form.get('nome')
@@ -42,13 +37,13 @@ def route_cadastrar_motorista():
         if not valor:
             return _json_error(400, "bad_request", f"{campo} é obrigatório")
 
-    tmp_path = None
     try:
-        tmp_path = _as_tempfile(img_fs, ".jpg")
+        # upload decodificado em memória (sem arquivo temporário)
+        imgs = [decodificar_upload(fs) for fs in imgs_fs]
         # serviço deve validar CPF/CNH, qualidade e extrair embedding
         motorista = cadastrar_motorista(
             dados={"nome": nome, "cpf": cpf, "cnh": cnh},
-            imagem_path=tmp_path
+            imagem=imgs
         )
         # motorista deve ser dict serializável retornado pelo serviço
         return jsonify({"ok": True, "motorista": motorista}), 201
@@ -57,9 +52,23 @@ def route_cadastrar_motorista():
         return _json_error(400, "validation_error", str(ve))
     except Exception as e:
         return _json_error(500, "internal_error", str(e))
-    finally:
-        if tmp_path and os.path.exists(tmp_path):
-            os.remove(tmp_path)
+
+@cadastro_bp.route('/motorista/<int:id_motorista>/biometria', methods=['POST'])
+def route_adicionar_template(id_motorista: int):
+    img_fs = request.files.get('imagem')
+    if not _is_image(img_fs):
+        return _json_error(400, "bad_request", "Imagem do motorista é obrigatória")
+
+    try:
+        img = decodificar_upload(img_fs)
+        resultado = adicionar_template_motorista(id_motorista, img)
+        return jsonify({"ok": True, "motorista": resultado}), 201
+    except LookupError as le:
+        return _json_error(404, "not_found", str(le))
+    except ValueError as ve:
+        return _json_error(400, "validation_error", str(ve))
+    except Exception as e:
+        return _json_error(500, "internal_error", str(e))
 
 @cadastro_bp.route('/caminhao/manual', methods=['POST'])
 def criar_caminhao_manual():
@@ -91,10 +100,9 @@ def criar_caminhao_por_imagem():
     if not modelo or not empresa:
         return _json_error(400, "bad_request", "modelo e empresa são obrigatórios")
 
-    tmp_path = None
     try:
-        tmp_path = _as_tempfile(img_fs, ".jpg")
-        placa_txt = reconhecer_placa(tmp_path, debug=False)
+        img = decodificar_upload(img_fs)
+        placa_txt = reconhecer_placa(img, debug=False)
         if not placa_txt:
             return _json_error(400, "ocr_failed", "Não foi possível reconhecer a placa na imagem")
 
@@ -105,6 +113,3 @@ def criar_caminhao_por_imagem():
         return _json_error(400, "validation_error", str(ve))
     except Exception as e:
         return _json_error(500, "internal_error", str(e))
-    finally:
-        if tmp_path and os.path.exists(tmp_path):
-            os.remove(tmp_path)
@@ -1,21 +1,14 @@
 from flask import Blueprint, request, jsonify
 from werkzeug.datastructures import FileStorage
-from sqlalchemy import func
-import tempfile, os, re
+import re
 
-from app.models import Caminhao
-from app.utils.face_utils import reconhecer_motorista_cadastrado
+from app.services.reconhecimento_service import localizar_caminhao
+from app.utils.image_io import decodificar_upload
+from app.utils.face_utils import reconhecer_motorista_cadastrado, reconhecer_motorista_top_k
 from app.utils.plate_utils import reconhecer_placa
 
 reconhecimento_bp = Blueprint('reconhecimento', __name__)
 
-def _as_tempfile(fs: FileStorage, suffix: str = ".jpg") -> str:
-    # Compatível com Windows: fecha o descritor antes de salvar
-    fd, path = tempfile.mkstemp(suffix=suffix)
-    os.close(fd)
-    fs.save(path)
-    return path
-
 def _is_image(fs: FileStorage) -> bool:
     mt = (fs.mimetype or "") if fs else ""
     fn = (fs.filename or "") if fs else ""
@@ -32,23 +25,25 @@ def reconhecer_completo():
     if not _is_image(rosto_fs) or not _is_image(placa_fs):
         return _json_error(400, "bad_request", "Arquivos de imagem ausentes ou inválidos")
 
-    rosto_path = placa_path = None
     try:
-        rosto_path = _as_tempfile(rosto_fs, ".jpg")
-        placa_path = _as_tempfile(placa_fs, ".jpg")
+        # decodifica direto da memória, sem arquivo temporário
+        rosto_img = decodificar_upload(rosto_fs)
+        placa_img = decodificar_upload(placa_fs)
+    except ValueError as ve:
+        return _json_error(400, "bad_request", str(ve))
+
+    try:
+        # paralelo opcional (form): "true"/"false"; ausente usa RECONHECIMENTO_PARALELO
+        paralelo_raw = (request.form.get('paralelo') or '').lower()
+        paralelo = None if not paralelo_raw else paralelo_raw in ('1', 'true', 'sim')
 
         from app.services.reconhecimento_service import processar_reconhecimento_completo
-        resultado = processar_reconhecimento_completo(rosto_path, placa_path)
+        resultado = processar_reconhecimento_completo(rosto_img, placa_img, paralelo=paralelo)
 
         # resultado deve ser dict serializável
         return jsonify({"ok": True, **(resultado or {})}), 200
     except Exception as e:
         return _json_error(500, "internal_error", str(e))
-    finally:
-        if rosto_path and os.path.exists(rosto_path):
-            os.remove(rosto_path)
-        if placa_path and os.path.exists(placa_path):
-            os.remove(placa_path)
 
 @reconhecimento_bp.route('/motorista', methods=['POST'])
 def route_reconhecer_motorista():
@@ -56,10 +51,30 @@ def route_reconhecer_motorista():
     if not _is_image(rosto_fs):
         return _json_error(400, "bad_request", "Imagem do rosto é obrigatória")
 
-    tmp_path = None
+    # k opcional (form ou query string): ativa o modo top-k com margem de ambiguidade
+    k_raw = request.form.get('k') or request.args.get('k')
+    k = None
+    if k_raw:
+        try:
+            k = int(k_raw)
+        except ValueError:
+            return _json_error(400, "bad_request", "k deve ser inteiro")
+        if k < 1:
+            return _json_error(400, "bad_request", "k deve ser >= 1")
+
     try:
-        tmp_path = _as_tempfile(rosto_fs, ".jpg")
-        motorista, confianca = reconhecer_motorista_cadastrado(tmp_path)
+        rosto_img = decodificar_upload(rosto_fs)
+    except ValueError as ve:
+        return _json_error(400, "bad_request", str(ve))
+
+    try:
+        if k is not None:
+            resultado = reconhecer_motorista_top_k(rosto_img, k=k)
+            if not resultado["candidatos"]:
+                return _json_error(404, "not_found", "Motorista não reconhecido")
+            return jsonify({"ok": True, **resultado}), 200
+
+        motorista, confianca = reconhecer_motorista_cadastrado(rosto_img)
 
         if not motorista:
             return _json_error(404, "not_found", "Motorista não reconhecido")
@@ -74,9 +89,6 @@ def route_reconhecer_motorista():
         }), 200
     except Exception as e:
         return _json_error(500, "internal_error", str(e))
-    finally:
-        if tmp_path and os.path.exists(tmp_path):
-            os.remove(tmp_path)
 
 @reconhecimento_bp.route('/caminhao', methods=['POST'])
 def route_reconhecer_caminhao():
@@ -84,16 +96,19 @@ def route_reconhecer_caminhao():
     if not _is_image(placa_fs):
         return _json_error(400, "bad_request", "Imagem da placa é obrigatória")
 
-    tmp_path = None
     try:
-        tmp_path = _as_tempfile(placa_fs, ".jpg")
-        placa = reconhecer_placa(tmp_path)
+        placa_img = decodificar_upload(placa_fs)
+    except ValueError as ve:
+        return _json_error(400, "bad_request", str(ve))
+
+    try:
+        placa = reconhecer_placa(placa_img)
 
         if not placa:
             return _json_error(404, "not_found", "Placa não reconhecida")
 
         placa_norm = re.sub(r'[^A-Z0-9]', '', placa.upper())
-        caminhao = Caminhao.query.filter(func.upper(Caminhao.placa) == placa_norm).first()
+        caminhao, correspondencia = localizar_caminhao(placa_norm)
 
         if not caminhao:
             return _json_error(404, "not_found", f"Caminhão com placa {placa_norm} não encontrado")
@@ -105,10 +120,8 @@ def route_reconhecer_caminhao():
                 "placa": caminhao.placa,
                 "modelo": getattr(caminhao, "modelo", None),
                 "empresa": getattr(caminhao, "empresa", None),
+                "correspondencia": correspondencia,
             }
         }), 200
     except Exception as e:
         return _json_error(500, "internal_error", str(e))
-    finally:
-        if tmp_path and os.path.exists(tmp_path):
-            os.remove(tmp_path)
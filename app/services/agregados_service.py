@@ -0,0 +1,216 @@
+import os
+import logging
+from datetime import datetime, date, time, timedelta
+from typing import Dict, Any, List, Optional, Union
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import func, cast, literal, Integer, Text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.database import db
+from app.models import AgregadoPesagem, AgregadoCaminhao, CicloPesagem, Caminhao
+
+DIMENSOES = ('dia', 'empresa', 'motorista', 'hora')
+# fuso que define "dia" e "hora" dos agregados, igual no incremento (Python) e no backfill (SQL)
+FUSO = os.getenv("AGREGADOS_FUSO", "America/Sao_Paulo")
+_ZONA = ZoneInfo(FUSO)
+
+logger = logging.getLogger(__name__)
+
+
+# ------------------ Períodos ------------------
+# Os filtros de=/ate= valem igual no histórico, na exportação e nos agregados:
+# dias inteiros e inclusivos no fuso AGREGADOS_FUSO; datetime sem fuso é local dele.
+def dia_local(valor: Union[date, datetime, None]) -> Optional[date]:
+    """Dia de `valor` no fuso dos agregados."""
+    if valor is None or not isinstance(valor, datetime):
+        return valor
+    return valor.astimezone(_ZONA).date() if valor.tzinfo else valor.date()
+
+def instante_local(valor: Union[date, datetime, None], fim: bool = False) -> Optional[datetime]:
+    """
+    Limite com fuso para comparar com colunas timestamptz. Uma data pura vira o
+    início do dia; com `fim=True`, o início do dia seguinte (limite exclusivo que
+    inclui o dia inteiro).
+    """
+    if valor is None:
+        return None
+    if not isinstance(valor, datetime):
+        return datetime.combine(valor + timedelta(days=1) if fim else valor, time(), tzinfo=_ZONA)
+    return valor if valor.tzinfo else valor.replace(tzinfo=_ZONA)
+
+
+# ------------------ Atualização incremental ------------------
+def _chaves(empresa: Optional[str], motorista_id: int, quando: datetime) -> List[tuple]:
+    return [
+        ('dia', ''),
+        ('empresa', empresa or ''),
+        ('motorista', str(motorista_id)),
+        ('hora', f"{quando.hour:02d}"),
+    ]
+
+def acumular_ciclo(ciclo: CicloPesagem, quando: Optional[datetime] = None) -> None:
+    """
+    Soma um ciclo recém-fechado às linhas do dia (uma por dimensão) com
+    INSERT ... ON CONFLICT DO UPDATE: incremento atômico, seguro entre workers.
+    `caminhoes` só sobe quando o caminhão ainda não constava na linha
+    (tb_agregados_caminhoes).
+    Não faz commit; roda na transação de `registrar_saida`. Dia e hora no fuso
+    AGREGADOS_FUSO.
+    """
+    quando = (quando or datetime.now().astimezone()).astimezone(_ZONA)
+    empresa = (
+        db.session.query(Caminhao.empresa)
+        .filter(Caminhao.id_caminhao == ciclo.caminhao_id)
+        .scalar()
+    )
+    dia = quando.date()
+    chaves = _chaves(empresa, ciclo.motorista_id, quando)
+
+    # linhas em que este caminhão aparece pela primeira vez no dia
+    vistos = pg_insert(AgregadoCaminhao).values([
+        {'dia': dia, 'dimensao': dimensao, 'chave': chave, 'caminhao_id': ciclo.caminhao_id}
+        for dimensao, chave in chaves
+    ]).on_conflict_do_nothing().returning(AgregadoCaminhao.dimensao, AgregadoCaminhao.chave)
+    novos = {(r.dimensao, r.chave) for r in db.session.execute(vistos)}
+
+    tem_peso = ciclo.peso_liquido is not None
+    linhas = [{
+        'dia': dia,
+        'dimensao': dimensao,
+        'chave': chave,
+        'ciclos': 1,
+        'caminhoes': 1 if (dimensao, chave) in novos else 0,
+        'peso_liquido_total': float(ciclo.peso_liquido) if tem_peso else 0.0,
+        'peso_liquido_n': 1 if tem_peso else 0,
+    } for dimensao, chave in chaves]
+
+    stmt = pg_insert(AgregadoPesagem).values(linhas)
+    stmt = stmt.on_conflict_do_update(
+        constraint='uq_agregados_pesagem_dia_dimensao_chave',
+        set_={
+            'ciclos': AgregadoPesagem.ciclos + stmt.excluded.ciclos,
+            'caminhoes': AgregadoPesagem.caminhoes + stmt.excluded.caminhoes,
+            'peso_liquido_total': AgregadoPesagem.peso_liquido_total + stmt.excluded.peso_liquido_total,
+            'peso_liquido_n': AgregadoPesagem.peso_liquido_n + stmt.excluded.peso_liquido_n,
+        },
+    )
+    db.session.execute(stmt)
+
+
+# ------------------ Backfill ------------------
+def _expr_chave(dimensao: str, hora):
+    """Expressão da chave no GROUP BY; None na dimensão 'dia' (uma linha por dia)."""
+    if dimensao == 'dia':
+        return None
+    if dimensao == 'empresa':
+        return func.coalesce(Caminhao.empresa, '')
+    if dimensao == 'motorista':
+        return cast(CicloPesagem.motorista_id, Text)
+    return func.lpad(cast(cast(hora, Integer), Text), 2, '0')
+
+def recalcular_agregados(inicio: Optional[date] = None, fim: Optional[date] = None) -> int:
+    """
+    Reconstrói os agregados a partir de `ciclos_pesagem` com GROUP BY no banco,
+    substituindo as linhas existentes do período [inicio, fim]. Retorna quantas
+    linhas foram gravadas. Dia e hora no fuso AGREGADOS_FUSO, não no da sessão do
+    banco, para bater com `acumular_ciclo`.
+    """
+    saida = CicloPesagem.data_saida
+    saida_local = func.timezone(FUSO, saida)
+    hora = func.extract('hour', saida_local)
+    dia_expr = func.date(saida_local)
+
+    try:
+        for modelo in (AgregadoPesagem, AgregadoCaminhao):
+            apagar = modelo.query
+            if inicio is not None:
+                apagar = apagar.filter(modelo.dia >= inicio)
+            if fim is not None:
+                apagar = apagar.filter(modelo.dia <= fim)
+            apagar.delete(synchronize_session=False)
+
+        total = 0
+        for dimensao in DIMENSOES:
+            chave = _expr_chave(dimensao, hora)
+            # chave constante fica fora do GROUP BY: o PostgreSQL recusa constante ali
+            agrupar = (dia_expr,) if chave is None else (dia_expr, chave)
+            chave_sel = (literal('') if chave is None else chave).label('chave')
+            colunas = [
+                dia_expr.label('dia'),
+                chave_sel,
+                func.count().label('ciclos'),
+                func.count(func.distinct(CicloPesagem.caminhao_id)).label('caminhoes'),
+                func.coalesce(func.sum(CicloPesagem.peso_liquido), 0.0).label('peso_liquido_total'),
+                func.count(CicloPesagem.peso_liquido).label('peso_liquido_n'),
+            ]
+
+            query = (
+                db.session.query(*colunas)
+                .select_from(CicloPesagem)
+                .join(Caminhao, Caminhao.id_caminhao == CicloPesagem.caminhao_id)
+                .filter(saida.isnot(None))
+            )
+            if inicio is not None:
+                query = query.filter(dia_expr >= inicio)
+            if fim is not None:
+                query = query.filter(dia_expr <= fim)
+
+            # conjunto de caminhões já contados, para o incremento seguir deduplicando
+            distintos = query.with_entities(
+                dia_expr, literal(dimensao), chave_sel, CicloPesagem.caminhao_id
+            ).distinct()
+            db.session.execute(pg_insert(AgregadoCaminhao).from_select(
+                ['dia', 'dimensao', 'chave', 'caminhao_id'], distintos.statement
+            ))
+
+            for row in query.group_by(*agrupar):
+                db.session.add(AgregadoPesagem(
+                    dia=row.dia,
+                    dimensao=dimensao,
+                    chave=row.chave,
+                    ciclos=row.ciclos,
+                    caminhoes=row.caminhoes,
+                    peso_liquido_total=float(row.peso_liquido_total),
+                    peso_liquido_n=row.peso_liquido_n,
+                ))
+                total += 1
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    logger.info("Agregados de pesagem recalculados: %d linhas", total)
+    return total
+
+
+# ------------------ Consulta ------------------
+def get_agregados(dimensao: str = 'dia', inicio: Union[date, datetime, None] = None,
+                  fim: Union[date, datetime, None] = None) -> List[Dict[str, Any]]:
+    """
+    Linhas dos dias [inicio, fim] (O(dias) por dimensão), com a média de peso
+    líquido já calculada. Datetimes valem pelo dia no fuso AGREGADOS_FUSO.
+    """
+    if dimensao not in DIMENSOES:
+        raise ValueError(f"dimensao deve ser uma de {', '.join(DIMENSOES)}")
+    inicio, fim = dia_local(inicio), dia_local(fim)
+    query = AgregadoPesagem.query.with_entities(
+        AgregadoPesagem.dia,
+        AgregadoPesagem.chave,
+        AgregadoPesagem.ciclos,
+        AgregadoPesagem.caminhoes,
+        AgregadoPesagem.peso_liquido_total,
+        AgregadoPesagem.peso_liquido_n,
+    ).filter(AgregadoPesagem.dimensao == dimensao)
+    if inicio is not None:
+        query = query.filter(AgregadoPesagem.dia >= inicio)
+    if fim is not None:
+        query = query.filter(AgregadoPesagem.dia <= fim)
+
+    return [{
+        'dia': r.dia.isoformat(),
+        'chave': r.chave,
+        'ciclos': r.ciclos,
+        'caminhoes': r.caminhoes,
+        'peso_liquido_total': r.peso_liquido_total,
+        'peso_liquido_medio': (r.peso_liquido_total / r.peso_liquido_n) if r.peso_liquido_n else None,
+    } for r in query.order_by(AgregadoPesagem.dia, AgregadoPesagem.chave)]
@@ -1,33 +1,70 @@
+import io
+import os
+import re
+import csv
+import json
 from app.models import CicloPesagem, Pesagem, Caminhao, Motorista
 from app.database import db
 from datetime import datetime
+from sqlalchemy import func
+from app.services.agregados_service import acumular_ciclo, instante_local
 
 
-def registrar_entrada(placa, motorista_id, peso):
-    caminhao = Caminhao.query.filter_by(placa=placa).first()
+def registrar_entrada(placa, motorista_id, peso, commit=True):
+    """
+    Abre um ciclo de pesagem. Com commit=False só faz flush (o id já fica disponível)
+    e deixa o commit para quem controla a transação (ex.: a portaria automática).
+    """
+    # placa normalizada: usa o índice ix_tb_caminhoes_placa_upper
+    placa_norm = re.sub(r'[^A-Z0-9]', '', (placa or '').upper())
+    caminhao = Caminhao.query.filter(func.upper(Caminhao.placa) == placa_norm).first()
     if not caminhao:
         raise ValueError("Caminhão não cadastrado")
 
     ciclo = CicloPesagem(
         caminhao_id=caminhao.id_caminhao,
         motorista_id=motorista_id,
-        data_entrada=datetime.now().time(),
+        data_entrada=datetime.now().astimezone(),
         peso_entrada=peso
     )
     db.session.add(ciclo)
-    db.session.commit()
+    if commit:
+        db.session.commit()
+    else:
+        db.session.flush()
     return ciclo.id_pesagem
 
 
-def registrar_saida(evento_id, peso):
+def registrar_saida(evento_id, peso, commit=True):
     ciclo = CicloPesagem.query.get(evento_id)
     if not ciclo:
         raise ValueError("Ciclo de pesagem não encontrado")
 
-    ciclo.data_saida = datetime.now().time()
+    ja_fechado = ciclo.data_saida is not None
+    agora = datetime.now().astimezone()
+    ciclo.data_saida = agora
     ciclo.peso_saida = peso
     ciclo.peso_liquido = peso - ciclo.peso_entrada if ciclo.peso_entrada else None
-    db.session.commit()
+    # agregados diários na mesma transação; uma nova saída do mesmo ciclo não soma
+    # de novo (o backfill corrige os totais se o peso tiver sido corrigido)
+    if not ja_fechado:
+        acumular_ciclo(ciclo, agora)
+    if commit:
+        db.session.commit()
+    else:
+        db.session.flush()
+
+
+def get_ciclo_aberto(caminhao_id):
+    """Id do ciclo em aberto (sem saída) mais recente do caminhão, ou None."""
+    return (
+        db.session.query(CicloPesagem.id_pesagem)
+        .filter(CicloPesagem.caminhao_id == caminhao_id)
+        .filter(CicloPesagem.data_saida.is_(None))
+        .order_by(CicloPesagem.id_pesagem.desc())
+        .limit(1)
+        .scalar()
+    )
 
 
 def get_motoristas():
@@ -36,20 +73,127 @@ def get_motoristas():
 def get_caminhao():
     return Caminhao.query.with_entities(Caminhao.id_caminhao, Caminhao.placa).all()
 
+def _ciclos_com_placa_e_motorista(*colunas):
+    """Consulta de ciclos já unida a caminhão e motorista, projetando só `colunas`."""
+    return (
+        db.session.query(*colunas)
+        .join(Caminhao, Caminhao.id_caminhao == CicloPesagem.caminhao_id)
+        .join(Motorista, Motorista.id_motorista == CicloPesagem.motorista_id)
+    )
+
 def get_ciclos_abertos():
     return (
-        db.session.query(
+        _ciclos_com_placa_e_motorista(
             CicloPesagem.id_pesagem,
             Caminhao.placa,
             Motorista.nome
         )
-        .join(Caminhao, Caminhao.id_caminhao == CicloPesagem.caminhao_id)
-        .join(Motorista, Motorista.id_motorista == CicloPesagem.motorista_id)
         .filter(CicloPesagem.data_saida.is_(None))
         .all()
     )
 
 
-def get_historico():
-    ciclos = CicloPesagem.query.order_by(CicloPesagem.id_pesagem.desc()).all()
-    return [c.to_dict() for c in ciclos]
+# colunas do histórico/exportação (projeção, sem hidratar objetos do ORM)
+COLUNAS_CICLO = (
+    CicloPesagem.id_pesagem,
+    CicloPesagem.caminhao_id,
+    Caminhao.placa,
+    Caminhao.empresa,
+    CicloPesagem.motorista_id,
+    Motorista.nome.label("motorista"),
+    CicloPesagem.data_entrada,
+    CicloPesagem.peso_entrada,
+    CicloPesagem.data_saida,
+    CicloPesagem.peso_saida,
+    CicloPesagem.peso_liquido,
+)
+
+def _serializar(valor):
+    return valor.isoformat() if hasattr(valor, "isoformat") else valor
+
+def ciclo_para_dict(row):
+    return {k: _serializar(v) for k, v in row._asdict().items()}
+
+def _filtro_periodo(query, inicio=None, fim=None):
+    """
+    Período sobre data_entrada (ix_ciclos_pesagem_data_entrada), com a mesma
+    regra de /agregados: data pura inclui o dia inteiro (`fim` inclusivo) no fuso
+    AGREGADOS_FUSO; datetime é um instante, com `fim` exclusivo.
+    """
+    inicio, fim = instante_local(inicio), instante_local(fim, fim=True)
+    if inicio is not None:
+        query = query.filter(CicloPesagem.data_entrada >= inicio)
+    if fim is not None:
+        query = query.filter(CicloPesagem.data_entrada < fim)
+    return query
+
+def filtrar_ciclos(query, caminhao_id=None, placa=None, motorista_id=None,
+                   inicio=None, fim=None, status=None):
+    """Aplica os filtros comuns ao histórico e à exportação."""
+    if caminhao_id is not None:
+        query = query.filter(CicloPesagem.caminhao_id == caminhao_id)
+    if placa:
+        query = query.filter(func.upper(Caminhao.placa) == placa.upper())
+    if motorista_id is not None:
+        query = query.filter(CicloPesagem.motorista_id == motorista_id)
+    if status == "aberto":
+        query = query.filter(CicloPesagem.data_saida.is_(None))
+    elif status == "fechado":
+        query = query.filter(CicloPesagem.data_saida.isnot(None))
+    elif status is not None:
+        raise ValueError("status deve ser 'aberto' ou 'fechado'")
+    return _filtro_periodo(query, inicio, fim)
+
+
+def get_historico(cursor=None, limite=50, **filtros):
+    """
+    Página do histórico em ordem decrescente de id_pesagem, por keyset: `cursor` é
+    o último id da página anterior (WHERE id_pesagem < cursor), então o custo de
+    cada página não cresce com a tabela. Retorna (itens, proximo_cursor).
+    """
+    query = filtrar_ciclos(_ciclos_com_placa_e_motorista(*COLUNAS_CICLO), **filtros)
+    if cursor is not None:
+        query = query.filter(CicloPesagem.id_pesagem < cursor)
+    rows = query.order_by(CicloPesagem.id_pesagem.desc()).limit(limite + 1).all()
+
+    proximo = rows[limite - 1].id_pesagem if len(rows) > limite else None
+    return [ciclo_para_dict(r) for r in rows[:limite]], proximo
+
+
+EXPORT_LOTE = int(os.getenv("BALANCA_EXPORT_LOTE", "1000"))
+
+def exportar_ciclos(formato="csv", **filtros):
+    """
+    Gera a exportação em pedaços de texto (CSV ou NDJSON) com memória constante:
+    a consulta usa yield_per (cursor no servidor com psycopg2) e cada lote de
+    EXPORT_LOTE linhas é enviado assim que formatado. O cabeçalho do CSV sai antes
+    da consulta, então o cliente recebe o primeiro byte imediatamente.
+    """
+    if formato not in ("csv", "ndjson"):
+        raise ValueError("formato deve ser 'csv' ou 'ndjson'")
+    query = (
+        filtrar_ciclos(_ciclos_com_placa_e_motorista(*COLUNAS_CICLO), **filtros)
+        .order_by(CicloPesagem.id_pesagem)
+        .execution_options(yield_per=EXPORT_LOTE)
+    )
+
+    buf = io.StringIO()
+    escritor = csv.writer(buf)
+    if formato == "csv":
+        escritor.writerow([c.key for c in COLUNAS_CICLO])
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+
+    for i, row in enumerate(query, start=1):
+        if formato == "csv":
+            escritor.writerow([_serializar(v) for v in row])
+        else:
+            buf.write(json.dumps(ciclo_para_dict(row), ensure_ascii=False))
+            buf.write("\n")
+        if i % EXPORT_LOTE == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
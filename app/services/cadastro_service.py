@@ -1,13 +1,24 @@
-from typing import Dict, Any
+from typing import Dict, Any, List, Union
 from sqlalchemy import func
 from sqlalchemy.exc import IntegrityError
+import os
 import re
+import logging
+import numpy as np
 
 from app.database import db # ajuste para onde você expõe o SQLAlchemy
 from app.models import Motorista, Caminhao
-from app.utils.face_utils import validar_qualidade_imagem, extrair_biometria_facial
+from app.utils.face_utils import validar_qualidade_imagem, extrair_biometria_facial, AnaliseFacial, DEFAULT_TOL
+from app.utils.face_gallery import get_galeria
+from app.utils.image_io import Imagem
+from app.utils.plate_index import get_indice_placas
 
 
+logger = logging.getLogger(__name__)
+
+# fotos (templates) aceitas por motorista
+MAX_TEMPLATES = int(os.getenv("FACE_MAX_TEMPLATES", "5"))
+
 _PADRAO_PLACA_BR = re.compile(r'^[A-Z]{3}[0-9][A-Z0-9][0-9]{2}$')
 
 def _digits(txt: str) -> str:
@@ -38,7 +49,33 @@ def _valida_placa(placa_norm: str) -> bool:
 
 
 
-def cadastrar_motorista(dados: Dict[str, Any], imagem_path: str) -> Dict[str, Any]:
+def _extrair_templates(imagens: List[Imagem]) -> np.ndarray:
+    """Valida cada imagem e retorna os encodings (M,128); a análise é compartilhada por imagem."""
+    encodings = []
+    for i, imagem in enumerate(imagens, start=1):
+        analise = AnaliseFacial(imagem)
+        ok, msg = validar_qualidade_imagem(analise)
+        if not ok:
+            raise ValueError(f"imagem {i} inválida: {msg}" if len(imagens) > 1 else f"imagem inválida: {msg}")
+        encoding = extrair_biometria_facial(analise)
+        if encoding is None:
+            raise ValueError("não foi possível extrair a biometria facial")
+        encodings.append(encoding)
+    return np.stack(encodings, axis=0).astype(np.float32)
+
+def _publicar_na_galeria(m: Motorista) -> None:
+    # disponibiliza o motorista na galeria deste worker sem recarga completa;
+    # os demais workers o recebem pelo carimbo de versão na próxima consulta
+    try:
+        get_galeria().adicionar(m.id_motorista, m.get_biometria(), m.raio_biometria or 0.0, m.get_templates())
+    except Exception as e:
+        logger.warning("Falha ao atualizar galeria facial (id=%s): %s", m.id_motorista, e)
+
+def cadastrar_motorista(dados: Dict[str, Any], imagem: Union[Imagem, List[Imagem]]) -> Dict[str, Any]:
+    """
+    Cadastra o motorista com uma ou mais fotos (até FACE_MAX_TEMPLATES). Com várias,
+    cada uma vira um template e `biometria` guarda o centróide usado na passada grossa.
+    """
     nome = (dados.get("nome") or "").strip()
     cpf  = _digits(dados.get("cpf"))
     cnh  = _digits(dados.get("cnh"))
@@ -50,14 +87,12 @@ def cadastrar_motorista(dados: Dict[str, Any], imagem_path: str) -> Dict[str, An
     if not _valida_cnh(cnh):
         raise ValueError("cnh inválida")
 
-    # qualidade da imagem
-    ok, msg = validar_qualidade_imagem(imagem_path)
-    if not ok:
-        raise ValueError(f"imagem inválida: {msg}")
-
-    encoding = extrair_biometria_facial(imagem_path)
-    if encoding is None:
-        raise ValueError("não foi possível extrair a biometria facial")
+    imagens = imagem if isinstance(imagem, list) else [imagem]
+    if not imagens:
+        raise ValueError("imagem do motorista é obrigatória")
+    if len(imagens) > MAX_TEMPLATES:
+        raise ValueError(f"no máximo {MAX_TEMPLATES} imagens por motorista")
+    templates = _extrair_templates(imagens)
 
     # unicidade por CPF e CNH
     ja_existe = (
@@ -69,13 +104,7 @@ def cadastrar_motorista(dados: Dict[str, Any], imagem_path: str) -> Dict[str, An
         raise ValueError("motorista já cadastrado (CPF/CNH)")
 
     m = Motorista(nome=nome, cpf=cpf, cnh=cnh)
-    # Armazene usando o método do seu modelo (assumindo que existe):
-    if hasattr(m, "set_biometria"):
-        m.set_biometria(encoding)
-    else:
-        # fallback: salve como lista (JSON) ou bytes se houver coluna apropriada
-        # ajuste conforme seu modelo
-        m.biom_embed = encoding.tolist()  # exemplo
+    m.set_templates(templates)
 
     db.session.add(m)
     try:
@@ -84,11 +113,47 @@ def cadastrar_motorista(dados: Dict[str, Any], imagem_path: str) -> Dict[str, An
         db.session.rollback()
         raise ValueError("violação de unicidade no banco (CPF/CNH/constraints)") from ie
 
+    _publicar_na_galeria(m)
+
     return {
         "id_motorista": m.id_motorista,
         "nome": m.nome,
         "cpf": m.cpf,
         "cnh": m.cnh,
+        "templates": int(templates.shape[0]),
+    }
+
+def adicionar_template_motorista(id_motorista: int, imagem: Imagem,
+                                 tolerancia: float = DEFAULT_TOL) -> Dict[str, Any]:
+    """
+    Acrescenta uma foto aos templates de um motorista já cadastrado. Recusa a foto
+    se ela estiver além da tolerância do centróide atual (provavelmente outra pessoa).
+    """
+    m = Motorista.query.get(id_motorista)
+    if not m:
+        raise LookupError("motorista não encontrado")
+
+    novo = _extrair_templates([imagem])
+    atuais = m.get_templates()
+    if atuais is None:
+        templates = novo
+    else:
+        if atuais.shape[0] >= MAX_TEMPLATES:
+            raise ValueError(f"motorista já possui {MAX_TEMPLATES} templates")
+        dist = float(np.linalg.norm(novo[0] - atuais.mean(axis=0)))
+        if dist > tolerancia:
+            raise ValueError(f"imagem não corresponde ao motorista (distância {dist:.3f})")
+        templates = np.concatenate([atuais, novo], axis=0)
+
+    m.set_templates(templates)
+    db.session.commit()
+
+    _publicar_na_galeria(m)
+
+    return {
+        "id_motorista": m.id_motorista,
+        "templates": int(templates.shape[0]),
+        "raio_biometria": round(float(m.raio_biometria or 0.0), 4),
     }
 
 def cadastrar_caminhao(placa: str, modelo: str, empresa: str) -> int:
@@ -113,4 +178,10 @@ def cadastrar_caminhao(placa: str, modelo: str, empresa: str) -> int:
         db.session.rollback()
         raise ValueError("violação de unicidade no banco (placa)") from ie
 
+    # mantém o índice aproximado de placas deste worker em dia sem recarga completa
+    try:
+        get_indice_placas().adicionar(c.id_caminhao, placa_norm)
+    except Exception as e:
+        logger.warning("Falha ao atualizar índice de placas (id=%s): %s", c.id_caminhao, e)
+
     return c.id_caminhao
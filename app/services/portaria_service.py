@@ -0,0 +1,139 @@
+import os
+import time
+import logging
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+from app.config import Config
+from app.database import db
+from app.models import Caminhao, Pesagem, RegistroReconhecimento
+from app.hardware.tc420_reader import get_leitor
+from app.services.balanca_service import registrar_entrada, registrar_saida, get_ciclo_aberto
+from app.services.reconhecimento_service import processar_reconhecimento_completo
+from app.utils.image_io import Imagem
+
+# tempo máximo esperando a balança assentar depois do reconhecimento
+ESPERA_ESTAVEL_S = float(os.getenv("PORTARIA_ESPERA_ESTAVEL_S", "20"))
+# peso mínimo (kg) aceito como caminhão na plataforma; abaixo disso a balança está vazia
+CARGA_MIN_KG = float(os.getenv("PORTARIA_CARGA_MIN_KG", "1000"))
+# distância máxima de placa aproximada aceita sem conferência; 0 = só placa exata
+PLACA_MAX_DIST = float(os.getenv("PORTARIA_PLACA_MAX_DIST", "0"))
+
+logger = logging.getLogger(__name__)
+
+
+def _ms(t0: float) -> float:
+    return round((time.perf_counter() - t0) * 1000, 1)
+
+
+class PortariaErro(Exception):
+    """Passagem não registrada; `codigo` vira o código de erro da resposta."""
+
+    def __init__(self, codigo: str, mensagem: str, detalhes: Optional[Dict[str, Any]] = None):
+        super().__init__(mensagem)
+        self.codigo = codigo
+        self.detalhes = detalhes or {}
+
+
+def _registrar(operacao: str, caminhao: Caminhao, motorista: Dict[str, Any],
+               peso: float, id_balanca: str) -> int:
+    """
+    Grava ciclo, pesagem e registro de reconhecimento numa única transação. O
+    caminhão é travado (SELECT ... FOR UPDATE) e o ciclo aberto relido, para que
+    duas passagens simultâneas do mesmo caminhão não abram/fechem ciclos em dobro.
+    """
+    try:
+        db.session.query(Caminhao.id_caminhao).filter(
+            Caminhao.id_caminhao == caminhao.id_caminhao
+        ).with_for_update().one()
+        ciclo_id = get_ciclo_aberto(caminhao.id_caminhao)
+        if (ciclo_id is not None) != (operacao == "saida"):
+            raise PortariaErro("conflito", "ciclo do caminhão mudou durante a passagem; tente novamente")
+
+        if operacao == "entrada":
+            ciclo_id = registrar_entrada(caminhao.placa, motorista["id_motorista"], peso, commit=False)
+        else:
+            registrar_saida(ciclo_id, peso, commit=False)
+
+        db.session.add(Pesagem(
+            ciclo_id=ciclo_id,
+            peso_kg=peso,
+            tipo=operacao,
+            data_hora=datetime.now().astimezone(),
+            origem_leitura=f"tc420:{id_balanca}",
+        ))
+        db.session.add(RegistroReconhecimento(
+            motorista_id=motorista["id_motorista"],
+            caminhao_id=caminhao.id_caminhao,
+            ciclo_id=ciclo_id,
+            confianca_facial=motorista.get("confianca"),
+            tipo_operacao=operacao,
+        ))
+        db.session.commit()
+        return ciclo_id
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def processar_passagem(imagem_rosto: Imagem, imagem_placa: Imagem,
+                       id_balanca: Optional[str] = None,
+                       espera_s: float = ESPERA_ESTAVEL_S) -> Dict[str, Any]:
+    """
+    Portaria automática: reconhece motorista e placa (exata, ou aproximada até
+    PORTARIA_PLACA_MAX_DIST), decide entre entrada e saída
+    pelo ciclo em aberto do caminhão, espera a primeira leitura estável da balança
+    correspondente (BALANCA_ENTRADA/BALANCA_SAIDA, ou `id_balanca`) chegada depois
+    do início da passagem e com ao menos PORTARIA_CARGA_MIN_KG, e registra tudo
+    numa transação. Lança PortariaErro quando a passagem não pode ser registrada.
+    """
+    t0 = time.perf_counter()
+    # só vale leitura posterior ao início da passagem (não a do caminhão anterior)
+    candidatas = {id_balanca} if id_balanca else {Config.BALANCA_ENTRADA, Config.BALANCA_SAIDA}
+    seqs = {b: get_leitor(b).seq_atual() for b in candidatas}
+    reconhecimento = processar_reconhecimento_completo(imagem_rosto, imagem_placa)
+    if not reconhecimento.get("sucesso"):
+        raise PortariaErro("nao_reconhecido", "motorista ou caminhão não reconhecido",
+                           {"reconhecimento": reconhecimento})
+    # placa aproximada (OCR truncado ou trocado) não registra sozinha: vai para conferência manual
+    correspondencia = reconhecimento["caminhao"].get("correspondencia") or {}
+    if correspondencia.get("tipo") != "exata" and not (
+        PLACA_MAX_DIST > 0 and correspondencia.get("distancia", float("inf")) <= PLACA_MAX_DIST
+    ):
+        raise PortariaErro("placa_aproximada",
+                           f"placa lida {correspondencia.get('placa_lida')} não confere exatamente com "
+                           f"{reconhecimento['caminhao']['placa']}; confirme manualmente",
+                           {"reconhecimento": reconhecimento, "candidato": reconhecimento["caminhao"]})
+
+    motorista = reconhecimento["motorista"]
+    caminhao = Caminhao.query.get(reconhecimento["caminhao"]["id_caminhao"])
+    operacao = "saida" if get_ciclo_aberto(caminhao.id_caminhao) is not None else "entrada"
+    # libera a conexão durante a espera pela balança
+    db.session.rollback()
+
+    id_balanca = id_balanca or (Config.BALANCA_SAIDA if operacao == "saida" else Config.BALANCA_ENTRADA)
+    t1 = time.perf_counter()
+    leitura = get_leitor(id_balanca).aguardar_estavel(espera_s, apos_seq=seqs.get(id_balanca),
+                                                      carga_min=CARGA_MIN_KG)
+    if leitura is None:
+        raise PortariaErro("balanca_instavel",
+                           f"balança {id_balanca} sem leitura estável acima de {CARGA_MIN_KG:.0f} kg em {espera_s:.0f}s",
+                           {"reconhecimento": reconhecimento, "operacao": operacao})
+    t_balanca = _ms(t1)
+
+    ciclo_id = _registrar(operacao, caminhao, motorista, leitura.peso, id_balanca)
+    logger.info("Portaria: %s do caminhão %s (ciclo %s, %.1f kg)", operacao, caminhao.placa, ciclo_id, leitura.peso)
+
+    return {
+        "operacao": operacao,
+        "id_pesagem": ciclo_id,
+        "peso": leitura.peso,
+        "balanca": id_balanca,
+        "motorista": motorista,
+        "caminhao": reconhecimento["caminhao"],
+        "tempos_ms": {
+            **reconhecimento.get("tempos_ms", {}),
+            "balanca": t_balanca,
+            "portaria_total": _ms(t0),
+        },
+    }
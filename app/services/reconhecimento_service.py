@@ -1,39 +1,113 @@
 import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 from sqlalchemy import func
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Tuple
 
 from app.models import Caminhao
 from app.utils.face_utils import reconhecer_motorista_cadastrado
 from app.utils.plate_utils import reconhecer_placa
+from app.utils.plate_index import get_indice_placas
+from app.utils.image_io import Imagem
 
 DEFAULT_TOL = float(os.getenv("FACE_TOLERANCIA", "0.6"))
+# face e placa em paralelo (dlib/OpenCV/torch liberam o GIL)
+PARALELO = os.getenv("RECONHECIMENTO_PARALELO", "true").lower() == "true"
+MAX_WORKERS = int(os.getenv("RECONHECIMENTO_WORKERS", "4"))
 
-def processar_reconhecimento_completo(path_rosto: str, path_placa: str) -> Dict[str, Any]:
+# Executor limitado e compartilhado entre requisições (um por processo)
+_EXECUTOR = None
+def _get_executor() -> ThreadPoolExecutor:
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        _EXECUTOR = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="reconhecimento")
+    return _EXECUTOR
+
+def _ms(t0: float) -> float:
+    return round((time.perf_counter() - t0) * 1000, 1)
+
+def localizar_caminhao(placa_txt: str) -> Tuple[Optional[Caminhao], Optional[Dict[str, Any]]]:
+    """
+    Busca o caminhão pela placa lida no OCR: primeiro exata; se falhar, no índice
+    aproximado da frota (distância de edição ponderada pelos pares de confusão).
+    Retorna (caminhao, {"tipo": "exata"|"aproximada", "distancia", "placa_lida"}).
+    """
+    placa_norm = re.sub(r'[^A-Z0-9]', '', (placa_txt or '').upper())
+    if not placa_norm:
+        return None, None
+
+    caminhao = Caminhao.query.filter(func.upper(Caminhao.placa) == placa_norm).first()
+    if caminhao:
+        return caminhao, {"tipo": "exata", "distancia": 0.0, "placa_lida": placa_norm}
+
+    indice = get_indice_placas()
+    indice.sincronizar()
+    achado = indice.buscar(placa_norm)
+    if not achado:
+        return None, None
+    id_caminhao, _, dist = achado
+    caminhao = Caminhao.query.get(id_caminhao)
+    if not caminhao:
+        return None, None
+    return caminhao, {"tipo": "aproximada", "distancia": dist, "placa_lida": placa_norm}
+
+def _etapa_face(imagem_rosto: Imagem) -> Tuple[Optional[Dict[str, Any]], float]:
+    t0 = time.perf_counter()
+    motorista, conf_face = reconhecer_motorista_cadastrado(imagem_rosto, tolerancia=DEFAULT_TOL)
+    if not motorista:
+        return None, _ms(t0)
+    return {
+        "id_motorista": motorista.id_motorista,
+        "nome": getattr(motorista, "nome", None),
+        "confianca": round(float(conf_face), 4)
+    }, _ms(t0)
+
+def _etapa_placa(imagem_placa: Imagem) -> Tuple[Optional[str], float]:
+    t0 = time.perf_counter()
+    placa_txt = reconhecer_placa(imagem_placa)
+    return placa_txt, _ms(t0)
+
+def processar_reconhecimento_completo(imagem_rosto: Imagem, imagem_placa: Imagem,
+                                      paralelo: Optional[bool] = None) -> Dict[str, Any]:
     resp: Dict[str, Any] = {"motorista": None, "placa": None, "caminhao": None}
+    paralelo = PARALELO if paralelo is None else paralelo
+    t0 = time.perf_counter()
+
+    if paralelo:
+        # a placa (sem acesso ao banco) roda no executor; a face, que consulta a
+        # galeria/banco, fica na thread da requisição, onde há app context
+        fut_placa = _get_executor().submit(_etapa_placa, imagem_placa)
+        try:
+            resp["motorista"], t_face = _etapa_face(imagem_rosto)
+        finally:
+            placa_txt, t_placa = fut_placa.result()
+    else:
+        resp["motorista"], t_face = _etapa_face(imagem_rosto)
+        placa_txt, t_placa = _etapa_placa(imagem_placa)
 
-    # Face
-    motorista, conf_face = reconhecer_motorista_cadastrado(path_rosto, tolerancia=DEFAULT_TOL)
-    if motorista:
-        resp["motorista"] = {
-            "id_motorista": motorista.id_motorista,
-            "nome": getattr(motorista, "nome", None),
-            "confianca": round(float(conf_face), 4)
-        }
-
-    # Placa
-    placa_txt = reconhecer_placa(path_placa)
+    # Caminhão
+    t1 = time.perf_counter()
     if placa_txt:
         placa_norm = placa_txt.upper()
         resp["placa"] = {"texto": placa_norm}
 
-        caminhao = Caminhao.query.filter(func.upper(Caminhao.placa) == placa_norm).first()
+        caminhao, correspondencia = localizar_caminhao(placa_norm)
         if caminhao:
             resp["caminhao"] = {
                 "id_caminhao": caminhao.id_caminhao,
                 "placa": caminhao.placa,
                 "modelo": getattr(caminhao, "modelo", None),
-                "empresa": getattr(caminhao, "empresa", None)
+                "empresa": getattr(caminhao, "empresa", None),
+                "correspondencia": correspondencia
             }
 
     resp["sucesso"] = bool(resp["motorista"] and resp["caminhao"])
+    resp["tempos_ms"] = {
+        "face": t_face,
+        "placa": t_placa,
+        "caminhao": _ms(t1),
+        "total": _ms(t0),
+        "paralelo": paralelo,
+    }
     return resp
@@ -0,0 +1,173 @@
+# app/utils/face_ann.py
+import os
+import math
+import logging
+import numpy as np
+from typing import List, Optional
+
+# ------------------ Config ------------------
+ANN_MODO = os.getenv("FACE_ANN", "off").lower()                 # "off" | "ivf"
+ANN_MIN_N = int(os.getenv("FACE_ANN_MIN_N", "5000"))            # abaixo disso a força bruta é mais barata
+ANN_NLIST = int(os.getenv("FACE_ANN_NLIST", "0"))               # 0 = automático (~sqrt(N))
+ANN_NPROBE = int(os.getenv("FACE_ANN_NPROBE", "8"))             # recall x latência: listas visitadas por consulta
+ANN_KMEANS_ITER = int(os.getenv("FACE_ANN_KMEANS_ITER", "12"))
+ANN_TREINO_MAX = int(os.getenv("FACE_ANN_TREINO_MAX", "50000"))  # amostra máxima para o k-means
+ANN_SEED = int(os.getenv("FACE_ANN_SEED", "42"))
+# se o melhor candidato do IVF ficar acima da tolerância, confirma com busca exata
+ANN_FALLBACK_EXATO = os.getenv("FACE_ANN_FALLBACK_EXATO", "true").lower() == "true"
+
+logger = logging.getLogger(__name__)
+
+# ------------------ Utils internos ------------------
+def _atribuir(vecs: np.ndarray, centroides: np.ndarray, bloco: int = 8192) -> np.ndarray:
+    """Índice do centróide mais próximo para cada linha de `vecs` (em blocos, memória constante)."""
+    c2 = np.einsum("ij,ij->i", centroides, centroides)
+    out = np.empty(vecs.shape[0], dtype=np.int32)
+    for ini in range(0, vecs.shape[0], bloco):
+        parte = vecs[ini:ini + bloco]
+        # ||v||² é constante por linha e não altera o argmin
+        d = c2[None, :] - 2.0 * (parte @ centroides.T)
+        out[ini:ini + bloco] = np.argmin(d, axis=1)
+    return out
+
+def _kmeans(vecs: np.ndarray, k: int, iters: int, rng: np.random.Generator) -> np.ndarray:
+    """Lloyd simples em NumPy; centróides iniciais amostrados sem reposição."""
+    centroides = vecs[rng.choice(vecs.shape[0], size=k, replace=False)].copy()
+    for _ in range(iters):
+        rotulos = _atribuir(vecs, centroides)
+        somas = np.zeros_like(centroides)
+        np.add.at(somas, rotulos, vecs)
+        contagem = np.bincount(rotulos, minlength=k).astype(np.float32)
+        vazios = contagem == 0
+        centroides[~vazios] = somas[~vazios] / contagem[~vazios, None]
+        if vazios.any():
+            # re-semeia clusters vazios com pontos aleatórios
+            centroides[vazios] = vecs[rng.choice(vecs.shape[0], size=int(vazios.sum()))]
+    return centroides
+
+# ------------------ Índice ------------------
+class IndiceIVF:
+    """
+    Índice IVF-Flat para os encodings 128-D: centróides grossos via k-means e
+    listas invertidas com as posições das linhas da galeria. A consulta visita as
+    `nprobe` listas mais próximas e calcula distâncias exatas só nesses candidatos.
+
+    O raio de uma lista cobre os templates dos membros: max(d(centróide, membro)
+    + raio do membro). Com a tolerância da busca, toda lista cujo limite inferior
+    d(q, centróide) - raio caiba nela também é visitada, então um template dentro
+    da tolerância não fica de fora só porque o centróide do motorista está longe.
+    """
+
+    def __init__(self, nlist: int = ANN_NLIST, nprobe: int = ANN_NPROBE):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.centroides = np.empty((0, 0), dtype=np.float32)
+        self.listas: List[np.ndarray] = []
+        self.raios_listas = np.empty(0, dtype=np.float32)
+        self.rotulos = np.empty(0, dtype=np.int32)   # lista de cada posição da galeria
+        self.n_treino = 0
+
+    @property
+    def treinado(self) -> bool:
+        return len(self.listas) > 0
+
+    def _alcance(self, vecs: np.ndarray, rotulos: np.ndarray, raios: np.ndarray) -> np.ndarray:
+        """d(centróide da lista, membro) + raio do membro, por linha."""
+        diff = vecs - self.centroides[rotulos]
+        return np.sqrt(np.einsum("ij,ij->i", diff, diff)) + raios
+
+    def _ampliar_raios(self, rotulos: np.ndarray, alcance: np.ndarray) -> None:
+        raios_listas = self.raios_listas.copy()
+        np.maximum.at(raios_listas, rotulos, alcance.astype(np.float32))
+        self.raios_listas = raios_listas
+
+    def _guardar_rotulos(self, posicoes: np.ndarray, rotulos: np.ndarray) -> None:
+        fim = int(posicoes.max()) + 1
+        if fim > self.rotulos.shape[0]:
+            maiores = np.full(max(fim, 2 * self.rotulos.shape[0]), -1, dtype=np.int32)
+            maiores[:self.rotulos.shape[0]] = self.rotulos
+            self.rotulos = maiores
+        self.rotulos[posicoes] = rotulos
+
+    def treinar(self, matriz: np.ndarray, raios: Optional[np.ndarray] = None) -> None:
+        n = matriz.shape[0]
+        raios = np.zeros(n, dtype=np.float32) if raios is None else raios
+        nlist = self.nlist or max(1, int(math.sqrt(n)))
+        nlist = min(nlist, n)
+        rng = np.random.default_rng(ANN_SEED)
+        amostra = matriz if n <= ANN_TREINO_MAX else matriz[rng.choice(n, size=ANN_TREINO_MAX, replace=False)]
+        centroides = _kmeans(np.asarray(amostra, dtype=np.float32), nlist, ANN_KMEANS_ITER, rng)
+        rotulos = _atribuir(matriz, centroides)
+        ordem = np.argsort(rotulos, kind="stable")
+        limites = np.searchsorted(rotulos[ordem], np.arange(nlist + 1))
+        self.listas = [ordem[limites[i]:limites[i + 1]].astype(np.int64) for i in range(nlist)]
+        self.centroides = centroides
+        self.rotulos = rotulos.astype(np.int32)
+        self.raios_listas = np.zeros(nlist, dtype=np.float32)
+        self._ampliar_raios(rotulos, self._alcance(matriz, rotulos, raios))
+        self.n_treino = n
+        logger.info("Índice IVF treinado: N=%d, nlist=%d, nprobe=%d", n, nlist, self.nprobe)
+
+    def adicionar(self, posicoes: np.ndarray, vecs: np.ndarray,
+                  raios: Optional[np.ndarray] = None) -> None:
+        """Insere novas linhas da galeria na lista do centróide mais próximo (sem re-treino)."""
+        if not self.treinado or len(posicoes) == 0:
+            return
+        posicoes = np.asarray(posicoes, dtype=np.int64)
+        vecs = np.asarray(vecs, dtype=np.float32)
+        raios = np.zeros(len(posicoes), dtype=np.float32) if raios is None else np.asarray(raios, dtype=np.float32)
+        rotulos = _atribuir(vecs, self.centroides)
+        # raios antes das listas: um leitor concorrente nunca vê o membro sem o alcance
+        self._ampliar_raios(rotulos, self._alcance(vecs, rotulos, raios))
+        self._guardar_rotulos(posicoes, rotulos)
+        for lista in np.unique(rotulos):
+            novos = posicoes[rotulos == lista]
+            self.listas[lista] = np.concatenate([self.listas[lista], novos])
+
+    def atualizar(self, posicoes: np.ndarray, vecs: np.ndarray, raios: np.ndarray) -> None:
+        """
+        Centróide/raio alterados (novos templates): move as linhas para a lista do
+        novo centróide e amplia o raio dela. Os raios só crescem até o re-treino.
+        """
+        if not self.treinado or len(posicoes) == 0:
+            return
+        posicoes = np.asarray(posicoes, dtype=np.int64)
+        vecs = np.asarray(vecs, dtype=np.float32)
+        raios = np.asarray(raios, dtype=np.float32)
+        rotulos = _atribuir(vecs, self.centroides)
+        antigos = np.full(len(posicoes), -1, dtype=np.int32)
+        conhecidas = posicoes < self.rotulos.shape[0]
+        antigos[conhecidas] = self.rotulos[posicoes[conhecidas]]
+        self._ampliar_raios(rotulos, self._alcance(vecs, rotulos, raios))
+        self._guardar_rotulos(posicoes, rotulos)
+        mudou = rotulos != antigos
+        # entra na lista nova antes de sair da antiga: a linha nunca some da busca
+        for lista in np.unique(rotulos[mudou]):
+            self.listas[lista] = np.concatenate([self.listas[lista], posicoes[mudou & (rotulos == lista)]])
+        for lista in np.unique(antigos[mudou & (antigos >= 0)]):
+            saem = posicoes[mudou & (antigos == lista)]
+            self.listas[lista] = self.listas[lista][~np.isin(self.listas[lista], saem)]
+
+    def candidatos(self, alvo: np.ndarray, nprobe: int = 0,
+                   limiar: Optional[float] = None) -> np.ndarray:
+        """
+        Posições das linhas nas `nprobe` listas mais próximas do alvo e, com
+        `limiar`, também nas listas cujo limite inferior d(q, centróide) - raio
+        fica dentro dele (podem conter um template a menos de `limiar`).
+        """
+        nprobe = min(nprobe or self.nprobe, len(self.listas))
+        q = np.asarray(alvo, dtype=np.float32).reshape(-1)
+        d2 = np.einsum("ij,ij->i", self.centroides, self.centroides) - 2.0 * (self.centroides @ q) + float(q @ q)
+        d = np.sqrt(np.maximum(d2, 0.0))
+        if nprobe < len(self.listas):
+            proximas = np.argpartition(d, nprobe - 1)[:nprobe]
+            if limiar is not None:
+                proximas = np.union1d(proximas, np.flatnonzero(d - self.raios_listas <= limiar))
+        else:
+            proximas = np.arange(len(self.listas))
+        listas = self.listas
+        return np.concatenate([listas[i] for i in proximas])
+
+    def precisa_retreino(self, n_atual: int) -> bool:
+        """Re-treina quando a base dobra desde o último k-means (centróides ficam desbalanceados)."""
+        return not self.treinado or n_atual >= 2 * self.n_treino
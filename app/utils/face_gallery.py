@@ -0,0 +1,431 @@
+# app/utils/face_gallery.py
+import os
+import time
+import logging
+import threading
+import numpy as np
+from datetime import datetime, timedelta
+from sqlalchemy import func, or_
+from typing import Optional, Tuple, Any, Dict, NamedTuple
+
+from app.models import Motorista
+from app.utils.face_ann import IndiceIVF, ANN_MODO, ANN_MIN_N, ANN_FALLBACK_EXATO
+
+DIM_ENCODING = 128
+# Recarga completa periódica (s) para refletir exclusões/edições; 0 desativa
+GALERIA_RECARGA_S = float(os.getenv("FACE_GALERIA_RECARGA_S", "0"))
+# candidatos da passada grossa (centróide - raio) refinados com os templates completos
+TEMPLATES_TOP = int(os.getenv("FACE_TEMPLATES_TOP", "5"))
+# recuo (s) na releitura por biometria_atualizada_em, cobre commits fora de ordem
+GALERIA_MARGEM_S = float(os.getenv("FACE_GALERIA_MARGEM_S", "30"))
+
+_SEM_FILTRO = object()
+
+logger = logging.getLogger(__name__)
+
+# ------------------ Utils internos ------------------
+def _decodificar_biometria(raw: Any) -> Optional[np.ndarray]:
+    """
+    Converte o blob de `Motorista.biometria` em vetor (128,) float32.
+    Aceita buffers de 512 (float32) ou 1024 (float64) bytes.
+    """
+    if raw is None:
+        return None
+    buf = memoryview(raw)
+    if len(buf) == DIM_ENCODING * 4:
+        return np.frombuffer(buf, dtype=np.float32)
+    if len(buf) == DIM_ENCODING * 8:
+        return np.frombuffer(buf, dtype=np.float64).astype(np.float32)
+    return None
+
+def _decodificar_templates(raw: Any) -> Optional[np.ndarray]:
+    """Converte `Motorista.biometria_templates` (M*512 bytes, float32) em (M,128)."""
+    if not raw:
+        return None
+    buf = memoryview(raw)
+    if len(buf) % (DIM_ENCODING * 4) != 0:
+        return None
+    return np.frombuffer(buf, dtype=np.float32).reshape(-1, DIM_ENCODING)
+
+def distancias_l2(matriz: np.ndarray, normas2: np.ndarray, alvo: np.ndarray) -> np.ndarray:
+    """
+    Distância euclidiana de `alvo` (128,) contra todas as linhas de `matriz` (N,128)
+    num único produto matriz-vetor: ||a-b||² = ||a||² - 2a·b + ||b||².
+    """
+    q = np.asarray(alvo, dtype=np.float32).reshape(-1)
+    d2 = normas2 - 2.0 * (matriz @ q) + float(q @ q)
+    np.maximum(d2, 0.0, out=d2)
+    return np.sqrt(d2, out=d2)
+
+def top_k(ids: np.ndarray, dists: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Seleciona os k menores com ordenação parcial (argpartition, O(N)) e ordena
+    apenas esses k.
+    """
+    n = dists.shape[0]
+    k = min(k, n)
+    if k <= 0:
+        return ids[:0], dists[:0]
+    sel = np.argpartition(dists, k - 1)[:k] if k < n else np.arange(n)
+    sel = sel[np.argsort(dists[sel], kind="stable")]
+    return ids[sel], dists[sel]
+
+# ------------------ Galeria ------------------
+class _Estado(NamedTuple):
+    """Versão publicada da galeria; trocada numa única atribuição."""
+    ids: np.ndarray
+    matriz: np.ndarray
+    normas2: np.ndarray
+    raios: np.ndarray
+    indice: Optional[IndiceIVF]
+
+
+class GaleriaFacial:
+    """
+    Galeria 1:N em memória: todos os encodings em uma matriz contígua float32 (N,128)
+    com o vetor de ids ao lado. Carregada uma vez por processo e consultada com uma
+    única operação vetorizada.
+
+    Invalidação: cada worker guarda o maior id_motorista e o maior
+    biometria_atualizada_em já vistos. `sincronizar()` compara com os máximos do
+    banco (lookups de índice) e busca apenas as linhas novas ou alteradas;
+    alterações feitas no próprio worker entram via `adicionar()`.
+
+    Com FACE_ANN=ivf e N >= FACE_ANN_MIN_N a busca passa por um índice IVF
+    (ver face_ann) e re-ranqueia exatamente os candidatos das listas visitadas.
+
+    Multi-template: a matriz guarda o centróide de cada motorista e `raios` a
+    dispersão dos seus templates. A passada grossa ordena pelo limite inferior
+    d(q, centróide) - raio; só os FACE_TEMPLATES_TOP melhores são refinados com a
+    menor distância a um template completo.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buf = np.empty((0, DIM_ENCODING), dtype=np.float32)
+        self._buf_ids = np.empty(0, dtype=np.int64)
+        self._buf_raios = np.empty(0, dtype=np.float32)
+        self._indice: Optional[IndiceIVF] = None
+        self._templates: Dict[int, np.ndarray] = {}
+        self._estado = _Estado(self._buf_ids, self._buf, np.empty(0, dtype=np.float32), self._buf_raios, None)
+        self._n = 0
+        self._posicoes: Dict[int, int] = {}
+        self._max_id_visto = 0
+        self._atualizacao_vista: Optional[datetime] = None
+        self._carregada = False
+        self._carregada_em = 0.0
+        # treino do IVF em background: geração da carga e linhas alteradas durante o treino
+        self._geracao = 0
+        self._treinando = False
+        self._alteradas_no_treino: Optional[set] = None
+
+    @property
+    def tamanho(self) -> int:
+        return int(self._estado.ids.shape[0])
+
+    def _publicar(self, n: int) -> None:
+        matriz = self._buf[:n]
+        normas2 = np.einsum("ij,ij->i", matriz, matriz)
+        # troca atômica da referência: leitores concorrentes veem o estado antigo ou o novo
+        self._estado = _Estado(self._buf_ids[:n], matriz, normas2, self._buf_raios[:n], self._indice)
+
+    def _realocar(self, cap: int) -> None:
+        """Copia para buffers novos: as views já publicadas continuam nos antigos."""
+        n = self._n
+        buf = np.empty((cap, DIM_ENCODING), dtype=np.float32)
+        buf_ids = np.empty(cap, dtype=np.int64)
+        buf_raios = np.empty(cap, dtype=np.float32)
+        buf[:n] = self._buf[:n]
+        buf_ids[:n] = self._buf_ids[:n]
+        buf_raios[:n] = self._buf_raios[:n]
+        self._buf, self._buf_ids, self._buf_raios = buf, buf_ids, buf_raios
+
+    def _anexar(self, linhas) -> int:
+        """
+        Acrescenta (id, centróide, raio, templates) ao buffer com crescimento
+        geométrico. Chamar com o lock.
+        """
+        n = self._n
+        novos = [linha for linha in linhas if linha[0] not in self._posicoes]
+        if not novos:
+            return 0
+        total = n + len(novos)
+        if total > self._buf.shape[0]:
+            self._realocar(max(total, 2 * self._buf.shape[0], 64))
+        for k, (id_motorista, vec, raio, templates) in enumerate(novos, start=n):
+            self._buf[k] = vec
+            self._buf_ids[k] = id_motorista
+            self._buf_raios[k] = raio
+            self._posicoes[id_motorista] = k
+            if templates is not None:
+                self._templates[id_motorista] = templates
+        self._n = total
+        if self._indice is not None:
+            self._indice.adicionar(np.arange(n, total), self._buf[n:total], self._buf_raios[n:total])
+        self._publicar(total)
+        return len(novos)
+
+    def _ler_linhas(self, acima_de: int = 0, atualizados_desde: Any = _SEM_FILTRO):
+        """
+        Lê apenas as colunas biométricas do banco, sem hidratar objetos do ORM: ids
+        acima de `acima_de` e, se pedido, as linhas com biometria alterada desde
+        `atualizados_desde` (None = qualquer alteração registrada).
+        """
+        filtro = Motorista.id_motorista > acima_de
+        if atualizados_desde is None:
+            filtro = or_(filtro, Motorista.biometria_atualizada_em.isnot(None))
+        elif atualizados_desde is not _SEM_FILTRO:
+            filtro = or_(filtro, Motorista.biometria_atualizada_em >= atualizados_desde)
+        rows = (
+            Motorista.query
+            .with_entities(
+                Motorista.id_motorista,
+                Motorista.biometria,
+                Motorista.raio_biometria,
+                Motorista.biometria_templates,
+            )
+            .filter(filtro)
+            .filter(Motorista.biometria.isnot(None))
+            .order_by(Motorista.id_motorista)
+            .all()
+        )
+        for id_motorista, raw, raio, raw_templates in rows:
+            vec = _decodificar_biometria(raw)
+            if vec is not None:
+                yield int(id_motorista), vec, float(raio or 0.0), _decodificar_templates(raw_templates)
+
+    def _carimbo_banco(self) -> Tuple[int, Optional[datetime]]:
+        """(max id_motorista, max biometria_atualizada_em): dois lookups de índice."""
+        max_id, max_atualizacao = Motorista.query.with_entities(
+            func.max(Motorista.id_motorista),
+            func.max(Motorista.biometria_atualizada_em),
+        ).one()
+        return int(max_id or 0), max_atualizacao
+
+    def _aplicar(self, linhas) -> Tuple[int, int]:
+        """
+        Novos ids vão para o fim do buffer; ids já presentes (templates alterados)
+        são reescritos em cópia (copy-on-write). Chamar com o lock.
+        Retorna (novos, atualizados).
+        """
+        existentes = [linha for linha in linhas if linha[0] in self._posicoes]
+        novos = [linha for linha in linhas if linha[0] not in self._posicoes]
+        if existentes:
+            self._realocar(self._buf.shape[0])
+            for id_motorista, vec, raio, templates in existentes:
+                pos = self._posicoes[id_motorista]
+                self._buf[pos] = vec
+                self._buf_raios[pos] = raio
+                if templates is not None:
+                    self._templates[id_motorista] = templates
+                else:
+                    self._templates.pop(id_motorista, None)
+            # centróide mudou: a linha troca de lista no IVF e o raio da lista cresce
+            pos = np.array([self._posicoes[linha[0]] for linha in existentes], dtype=np.int64)
+            if self._indice is not None:
+                self._indice.atualizar(pos, self._buf[pos], self._buf_raios[pos])
+            if self._alteradas_no_treino is not None:
+                self._alteradas_no_treino.update(pos.tolist())
+            self._publicar(self._n)
+        return self._anexar(novos), len(existentes)
+
+    def _alterado_desde_visto(self, max_id: int, max_atualizacao: Optional[datetime]) -> bool:
+        if max_id > self._max_id_visto:
+            return True
+        if max_atualizacao is None:
+            return False
+        return self._atualizacao_vista is None or max_atualizacao > self._atualizacao_vista
+
+    def carregar(self) -> None:
+        """Recarga completa (primeiro uso ou recarga periódica)."""
+        with self._lock:
+            max_id, max_atualizacao = self._carimbo_banco()
+            linhas = list(self._ler_linhas())
+            # buffers novos; os leitores seguem na versão publicada até o próximo _publicar
+            self._buf = np.empty((0, DIM_ENCODING), dtype=np.float32)
+            self._buf_ids = np.empty(0, dtype=np.int64)
+            self._buf_raios = np.empty(0, dtype=np.float32)
+            self._n = 0
+            self._posicoes = {}
+            self._templates = {}
+            self._indice = None
+            self._geracao += 1
+            self._anexar(linhas)
+            self._publicar(self._n)
+            self._max_id_visto = max_id
+            self._atualizacao_vista = max_atualizacao
+            self._carregada = True
+            self._carregada_em = time.monotonic()
+            logger.info("Galeria facial carregada: %d encodings", self.tamanho)
+        # já na carga (aquecimento): o índice treina em background
+        self._garantir_indice()
+
+    def garantir_carregada(self) -> None:
+        if not self._carregada:
+            self.carregar()
+
+    def sincronizar(self) -> None:
+        """
+        Verificação barata por requisição: se outro worker cadastrou motoristas ou
+        alterou templates, carrega só os ids acima do último id visto e as linhas
+        com biometria_atualizada_em recente. A releitura recua FACE_GALERIA_MARGEM_S
+        do último carimbo visto, para não perder commits que chegaram fora de ordem.
+        """
+        if not self._carregada or (
+            GALERIA_RECARGA_S > 0 and time.monotonic() - self._carregada_em > GALERIA_RECARGA_S
+        ):
+            self.carregar()
+            return
+        max_id, max_atualizacao = self._carimbo_banco()
+        if not self._alterado_desde_visto(max_id, max_atualizacao):
+            return
+        with self._lock:
+            if not self._alterado_desde_visto(max_id, max_atualizacao):
+                return
+            vista = self._atualizacao_vista
+            desde = None if vista is None else vista - timedelta(seconds=GALERIA_MARGEM_S)
+            novos, atualizados = self._aplicar(list(self._ler_linhas(self._max_id_visto, desde)))
+            self._max_id_visto = max_id
+            if max_atualizacao is not None:
+                self._atualizacao_vista = max_atualizacao
+            logger.info("Galeria facial: +%d encodings, %d atualizados (id=%d)", novos, atualizados, max_id)
+
+    def adicionar(self, id_motorista: int, encoding: np.ndarray,
+                  raio: float = 0.0, templates: Optional[np.ndarray] = None) -> None:
+        """
+        Insere (ou atualiza) um motorista recém-commitado sem recarregar a galeria.
+        `encoding` é o centróide quando houver `templates`.
+        """
+        vec = np.asarray(encoding, dtype=np.float32).reshape(-1)
+        if vec.shape[0] != DIM_ENCODING:
+            raise ValueError("Encoding facial deve ter shape (128,)")
+        if templates is not None:
+            templates = np.asarray(templates, dtype=np.float32).reshape(-1, DIM_ENCODING)
+        with self._lock:
+            if not self._carregada:
+                # a primeira consulta fará a carga completa, incluindo este id
+                return
+            self._aplicar([(int(id_motorista), vec, float(raio), templates)])
+
+    def _precisa_indice(self) -> bool:
+        if ANN_MODO != "ivf" or self._n < ANN_MIN_N or self._treinando:
+            return False
+        return self._indice is None or self._indice.precisa_retreino(self._n)
+
+    def _garantir_indice(self) -> None:
+        """
+        Dispara o treino (ou re-treino) do IVF numa thread quando habilitado e a
+        base é grande o suficiente; a consulta não espera pelo k-means e segue na
+        busca exata (ou no índice anterior) até o novo ser publicado.
+        """
+        if not self._precisa_indice():
+            return
+        with self._lock:
+            if not self._precisa_indice():
+                return
+            self._treinando = True
+        threading.Thread(target=self._treinar_indice, name="galeria-ivf", daemon=True).start()
+
+    def _treinar_indice(self) -> None:
+        try:
+            with self._lock:
+                geracao, n = self._geracao, self._n
+                matriz = self._buf[:n].copy()
+                raios = self._buf_raios[:n].copy()
+                self._alteradas_no_treino = set()
+            indice = IndiceIVF()
+            indice.treinar(matriz, raios)
+            with self._lock:
+                alteradas, self._alteradas_no_treino = self._alteradas_no_treino, None
+                if geracao != self._geracao:
+                    return   # recarga completa no meio do treino: descarta
+                # o que mudou enquanto o k-means rodava entra agora
+                if self._n > n:
+                    indice.adicionar(np.arange(n, self._n), self._buf[n:self._n], self._buf_raios[n:self._n])
+                pos = np.array(sorted(p for p in alteradas if p < n), dtype=np.int64)
+                if pos.shape[0]:
+                    indice.atualizar(pos, self._buf[pos], self._buf_raios[pos])
+                self._indice = indice
+                self._publicar(self._n)
+        except Exception:
+            logger.exception("Falha ao treinar o índice IVF da galeria")
+        finally:
+            with self._lock:
+                self._alteradas_no_treino = None
+                self._treinando = False
+
+    def distancias(self, encoding: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Retorna (ids, distâncias ao centróide) de todos os motoristas (busca exata)."""
+        self.garantir_carregada()
+        est = self._estado
+        if est.ids.shape[0] == 0:
+            return est.ids, np.empty(0, dtype=np.float32)
+        return est.ids, distancias_l2(est.matriz, est.normas2, encoding)
+
+    def _passada_grossa(self, encoding: np.ndarray,
+                        limiar: Optional[float],
+                        nprobe: int,
+                        k: int = 1) -> Tuple[_Estado, np.ndarray, np.ndarray]:
+        """
+        (estado, posições, distâncias ao centróide) do conjunto a ordenar: candidatos
+        do IVF quando ativo, ou a galeria inteira. Com IVF, se o melhor limite
+        inferior ficar acima de `limiar` (ou vierem menos de k), confirma com a
+        busca exata (FACE_ANN_FALLBACK_EXATO) para não perder um match.
+        """
+        self.garantir_carregada()
+        self._garantir_indice()
+        est = self._estado
+        n = est.ids.shape[0]
+        if est.indice is not None:
+            pos = est.indice.candidatos(encoding, nprobe, limiar)
+            pos = pos[pos < n]
+            if pos.shape[0] >= k:
+                dists = distancias_l2(est.matriz[pos], est.normas2[pos], encoding)
+                best = float((dists - est.raios[pos]).min())
+                if limiar is None or best <= limiar or not ANN_FALLBACK_EXATO:
+                    return est, pos, dists
+        pos = np.arange(n)
+        if n == 0:
+            return est, pos, np.empty(0, dtype=np.float32)
+        return est, pos, distancias_l2(est.matriz, est.normas2, encoding)
+
+    def _refinar(self, est: _Estado, pos: np.ndarray, dists: np.ndarray,
+                 encoding: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k final: distância ao template mais próximo para os melhores limites inferiores."""
+        ids = est.ids[pos]
+        templates = self._templates
+        if not templates:
+            return top_k(ids, dists, k)
+        limite_inf = dists - est.raios[pos]
+        sel, _ = top_k(np.arange(pos.shape[0]), limite_inf, max(k, TEMPLATES_TOP))
+        q = np.asarray(encoding, dtype=np.float32).reshape(-1)
+        refinadas = np.empty(sel.shape[0], dtype=np.float32)
+        for j, i in enumerate(sel):
+            t = templates.get(int(ids[i]))
+            refinadas[j] = dists[i] if t is None else float(np.sqrt(((t - q) ** 2).sum(axis=1)).min())
+        return top_k(ids[sel], refinadas, k)
+
+    def buscar(self, encoding: np.ndarray,
+               limiar: Optional[float] = None,
+               nprobe: int = 0) -> Tuple[Optional[int], float]:
+        """Retorna (id do mais próximo, distância). (None, inf) se a galeria estiver vazia."""
+        ids, dists = self.buscar_top_k(encoding, 1, limiar, nprobe)
+        if ids.shape[0] == 0:
+            return None, float("inf")
+        return int(ids[0]), float(dists[0])
+
+    def buscar_top_k(self, encoding: np.ndarray, k: int,
+                     limiar: Optional[float] = None,
+                     nprobe: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+        """Retorna (ids, distâncias) dos k mais próximos, em ordem crescente de distância."""
+        est, pos, dists = self._passada_grossa(encoding, limiar, nprobe, k)
+        return self._refinar(est, pos, dists, encoding, k)
+
+
+# Singleton da galeria (uma por processo)
+_GALERIA = None
+def get_galeria() -> GaleriaFacial:
+    global _GALERIA
+    if _GALERIA is None:
+        _GALERIA = GaleriaFacial()
+    return _GALERIA
@@ -4,15 +4,24 @@ import cv2
 import math
 import logging
 import numpy as np
-import face_recognition
-from typing import Tuple, Optional, List, Any
+from typing import Tuple, Optional, List, Any, Dict, Union
 
 from app.models import Motorista
+from app.utils.model_loader import get_face_recognition
+from app.utils.image_io import Imagem, carregar_bgr, descrever_imagem
+from app.utils.face_gallery import get_galeria, distancias_l2
 
 # ------------------ Config ------------------
 FACE_DETECTOR_MODEL = os.getenv("FACE_DETECTOR_MODEL", "hog")   # "cnn" se dlib-cnn
 FACE_UPSAMPLE = int(os.getenv("FACE_UPSAMPLE", "1"))            # upsample para faces pequenas
 NUM_JITTERS = int(os.getenv("FACE_NUM_JITTERS", "3"))
+# Perfis de jitter: cadastro (qualidade do template) x consulta 1:N (latência).
+# A consulta só escala para NUM_JITTERS_ESCALADA quando a melhor distância cai
+# na faixa de incerteza DEFAULT_TOL ± FAIXA_INCERTEZA.
+NUM_JITTERS_CADASTRO = int(os.getenv("FACE_NUM_JITTERS_CADASTRO", str(NUM_JITTERS)))
+NUM_JITTERS_CONSULTA = int(os.getenv("FACE_NUM_JITTERS_CONSULTA", "1"))
+NUM_JITTERS_ESCALADA = int(os.getenv("FACE_NUM_JITTERS_ESCALADA", str(NUM_JITTERS_CADASTRO)))
+FAIXA_INCERTEZA = float(os.getenv("FACE_FAIXA_INCERTEZA", "0.05"))
 DEFAULT_TOL = float(os.getenv("FACE_TOLERANCIA", "0.6"))
 
 MIN_FOCUS_VAR = float(os.getenv("FACE_MIN_FOCUS_VAR", "60.0"))
@@ -20,7 +29,22 @@ MIN_BRIGHTNESS = float(os.getenv("FACE_MIN_BRIGHTNESS", "40.0"))
 MAX_BRIGHTNESS = float(os.getenv("FACE_MAX_BRIGHTNESS", "200.0"))
 MIN_FACE_SIZE_PX = int(os.getenv("FACE_MIN_SIZE_PX", "80"))
 
+# Detecção em baixa resolução (landmarks e encoding continuam na resolução original).
+# FACE_DETECT_MIN_PX: menor face que o HOG encontra com o upsample configurado
+# (janela de 80 px, dividida por 2 a cada upsample).
+DETECT_ESCALA_AUTO = os.getenv("FACE_DETECT_ESCALA_AUTO", "true").lower() == "true"
+DETECT_MIN_PX = int(os.getenv("FACE_DETECT_MIN_PX", str(80 // (2 ** FACE_UPSAMPLE))))
+DETECT_MARGEM = float(os.getenv("FACE_DETECT_MARGEM", "1.25"))
+
+# Alinhamento: "recorte" rotaciona só a vizinhança da face e mapeia a caixa pela
+# matriz afim; "quadro" rotaciona a imagem inteira e redetecta (comportamento antigo)
+ALIGN_MODO = os.getenv("FACE_ALIGN_MODO", "recorte").lower()
+ALIGN_PAD = float(os.getenv("FACE_ALIGN_PAD", "0.5"))   # margem do recorte, fração do lado da caixa
+
 CONF_STEEPNESS_K = float(os.getenv("FACE_CONF_STEEPNESS", "20.0"))
+# diferença mínima de distância entre 1º e 2º candidatos para aceitar sem revisão manual
+MARGEM_MIN = float(os.getenv("FACE_MARGEM_MIN", "0.08"))
+TOP_K_MAX = int(os.getenv("FACE_TOP_K_MAX", "20"))
 
 logger = logging.getLogger(__name__)
 
@@ -28,34 +52,63 @@ logger = logging.getLogger(__name__)
 def _laplacian_var(gray: np.ndarray) -> float:
     return float(cv2.Laplacian(gray, cv2.CV_64F).var())
 
-def _image_to_rgb(image_path: str) -> np.ndarray:
-    bgr = cv2.imread(image_path)
-    if bgr is None:
-        raise ValueError(f"Não foi possível ler a imagem em: {image_path}")
+def _image_to_rgb(imagem: Imagem) -> np.ndarray:
+    bgr = carregar_bgr(imagem)
     rgb = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
     return rgb
 
-def _align_by_eyes(rgb_img: np.ndarray, landmarks: dict) -> np.ndarray:
+def _angulo_olhos(landmarks: dict) -> Optional[float]:
     left_eye = landmarks.get("left_eye")
     right_eye = landmarks.get("right_eye")
     if not left_eye or not right_eye:
-        return rgb_img
+        return None
     left_center = np.mean(left_eye, axis=0)
     right_center = np.mean(right_eye, axis=0)
     dy = float(right_center[1] - left_center[1])
     dx = float(right_center[0] - left_center[0])
-    angle = math.degrees(math.atan2(dy, dx))
+    return math.degrees(math.atan2(dy, dx))
+
+def _align_by_eyes(rgb_img: np.ndarray, landmarks: dict) -> np.ndarray:
+    angle = _angulo_olhos(landmarks)
+    if angle is None:
+        return rgb_img
     h, w = rgb_img.shape[:2]
     M = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
     aligned = cv2.warpAffine(rgb_img, M, (w, h), flags=cv2.INTER_LINEAR)
     return aligned
 
+def _escala_deteccao() -> float:
+    """
+    Fator de redução para a detecção: o menor possível que ainda deixa uma face
+    válida (>= MIN_FACE_SIZE_PX) acima do mínimo que o detector enxerga
+    (FACE_DETECT_MIN_PX, com margem FACE_DETECT_MARGEM).
+    """
+    if not DETECT_ESCALA_AUTO:
+        return 1.0
+    escala = (DETECT_MIN_PX * DETECT_MARGEM) / float(MIN_FACE_SIZE_PX)
+    return escala if escala < 1.0 else 1.0
+
 def _detect_faces(rgb_img: np.ndarray) -> List[Tuple[int, int, int, int]]:
-    return face_recognition.face_locations(
-        rgb_img,
+    """Detecta em baixa resolução e devolve as caixas em coordenadas da imagem original."""
+    escala = _escala_deteccao()
+    if escala >= 1.0:
+        return get_face_recognition().face_locations(
+            rgb_img,
+            number_of_times_to_upsample=FACE_UPSAMPLE,
+            model=FACE_DETECTOR_MODEL
+        )
+
+    H, W = rgb_img.shape[:2]
+    small = cv2.resize(rgb_img, (max(1, int(W * escala)), max(1, int(H * escala))), interpolation=cv2.INTER_AREA)
+    boxes = get_face_recognition().face_locations(
+        small,
         number_of_times_to_upsample=FACE_UPSAMPLE,
         model=FACE_DETECTOR_MODEL
     )
+    return [
+        (max(0, int(t / escala)), min(W, int(r / escala)), min(H, int(b / escala)), max(0, int(l / escala)))
+        for t, r, b, l in boxes
+    ]
 
 def _ensure_rgb_uint8_c_contig(img: np.ndarray) -> np.ndarray:
     # garante 3 canais RGB, uint8 e memória contígua (requisito do dlib)
@@ -70,22 +123,50 @@ def _ensure_rgb_uint8_c_contig(img: np.ndarray) -> np.ndarray:
         out = np.ascontiguousarray(out)
     return out
 
-def _extract_single_face(rgb_img: np.ndarray) -> Optional[np.ndarray]:
+def _alinhar_so_recorte(rgb_img: np.ndarray, box: Tuple[int, int, int, int], angle: float) -> np.ndarray:
     """
-    Detecta UMA face. Alinha por olhos e recorta. Se !=1 face, retorna None.
-    Retorna recorte normalizado (RGB, uint8, C-contiguous).
+    Rotaciona apenas um recorte com margem em torno da caixa (não o quadro todo) e
+    mapeia a caixa pela matriz afim em vez de redetectar: a rotação é em torno do
+    centro da caixa e preserva escala, então a face alinhada ocupa uma caixa de
+    mesmo w×h centrada em M·centro.
+
+    Perto da borda do quadro a margem que falta é completada com borda replicada
+    (cv2.copyMakeBorder): o recorte tem sempre (h + 2·pad)×(w + 2·pad) e a face
+    sai com exatamente h×w, centrada.
     """
-    boxes = _detect_faces(rgb_img)
-    if len(boxes) != 1:
-        return None
-
-    top, right, bottom, left = boxes[0]
+    top, right, bottom, left = box
+    H, W = rgb_img.shape[:2]
+    w, h = right - left, bottom - top
+    pad = int(ALIGN_PAD * max(w, h))
+    x0, y0 = left - pad, top - pad
+    x1, y1 = right + pad, bottom + pad
+    crop = rgb_img[max(0, y0):min(H, y1), max(0, x0):min(W, x1)]
+    faltam = (max(0, -y0), max(0, y1 - H), max(0, -x0), max(0, x1 - W))
+    if any(faltam):
+        crop = cv2.copyMakeBorder(crop, *faltam, cv2.BORDER_REPLICATE)
+
+    cx, cy = pad + w / 2.0, pad + h / 2.0
+    M = cv2.getRotationMatrix2D((cx, cy), angle, 1.0)
+    aligned = cv2.warpAffine(crop, M, (crop.shape[1], crop.shape[0]), flags=cv2.INTER_LINEAR)
+
+    ncx, ncy = M @ np.array([cx, cy, 1.0])
+    l = int(round(max(0.0, ncx - w / 2.0)))
+    t = int(round(max(0.0, ncy - h / 2.0)))
+    return aligned[t:t + h, l:l + w]
+
+def _recorte_alinhado(rgb_img: np.ndarray, box: Tuple[int, int, int, int],
+                      landmarks: Optional[dict]) -> np.ndarray:
+    """Alinha por olhos (se houver landmarks) e recorta a face."""
+    top, right, bottom, left = box
     face = rgb_img[top:bottom, left:right]
 
-    # Alinhamento e redetecção
-    lmarks = face_recognition.face_landmarks(rgb_img, [boxes[0]])
-    if lmarks:
-        aligned = _align_by_eyes(rgb_img, lmarks[0])
+    if landmarks and ALIGN_MODO == "recorte":
+        angle = _angulo_olhos(landmarks)
+        if angle is not None:
+            face = _alinhar_so_recorte(rgb_img, box, angle)
+    elif landmarks:
+        # modo "quadro": rotação do quadro inteiro + redetecção
+        aligned = _align_by_eyes(rgb_img, landmarks)
         boxes_aligned = _detect_faces(aligned)
         if len(boxes_aligned) >= 1:
             t, r, b, l = boxes_aligned[0]
@@ -109,17 +190,17 @@ def _quality_checks(face_img: np.ndarray) -> Tuple[bool, dict]:
         return False, {**metrics, "reason": reason}
     return True, {**metrics, "reason": "ok"}
 
-def _encode_face(face_img: np.ndarray) -> Optional[np.ndarray]:
+def _encode_face(face_img: np.ndarray, num_jitters: int = NUM_JITTERS) -> Optional[np.ndarray]:
     """
     Extrai encoding 128-D do recorte de face normalizado.
     Usa known_face_locations para evitar nova detecção.
     """
     face_img = _ensure_rgb_uint8_c_contig(face_img)
     h, w = face_img.shape[:2]
-    enc = face_recognition.face_encodings(
+    enc = get_face_recognition().face_encodings(
         face_img,
         known_face_locations=[(0, w, h, 0)],
-        num_jitters=NUM_JITTERS,
+        num_jitters=num_jitters,
         model="small"
     )
     return enc[0] if enc else None
@@ -158,14 +239,73 @@ def _to_numpy_encoding(raw: Any) -> Optional[np.ndarray]:
         return None
     return arr.astype(np.float64, copy=False)
 
+# ------------------ Análise por imagem ------------------
+class AnaliseFacial:
+    """
+    Análise memoizada de UMA imagem: RGB decodificado, caixas detectadas,
+    landmarks, recorte alinhado, métricas de qualidade e encodings (por num_jitters).
+    Cada etapa roda no máximo uma vez, então validação e extração de biometria
+    sobre a mesma imagem compartilham a detecção e o alinhamento.
+    """
+
+    def __init__(self, imagem: Imagem):
+        self.imagem = imagem
+        self._cache: Dict[str, Any] = {}
+        self._encodings: Dict[int, Optional[np.ndarray]] = {}
+
+    def _memo(self, chave: str, fn):
+        if chave not in self._cache:
+            self._cache[chave] = fn()
+        return self._cache[chave]
+
+    @property
+    def rgb(self) -> np.ndarray:
+        return self._memo("rgb", lambda: _image_to_rgb(self.imagem))
+
+    @property
+    def boxes(self) -> List[Tuple[int, int, int, int]]:
+        return self._memo("boxes", lambda: _detect_faces(self.rgb))
+
+    @property
+    def landmarks(self) -> Optional[dict]:
+        """Landmarks da face única (None se a imagem não tiver exatamente uma face)."""
+        def _calc():
+            if len(self.boxes) != 1:
+                return None
+            lmarks = get_face_recognition().face_landmarks(self.rgb, [self.boxes[0]])
+            return lmarks[0] if lmarks else None
+        return self._memo("landmarks", _calc)
+
+    @property
+    def face(self) -> Optional[np.ndarray]:
+        """Recorte alinhado (RGB, uint8, C-contiguous) ou None se !=1 face."""
+        def _calc():
+            if len(self.boxes) != 1:
+                return None
+            return _recorte_alinhado(self.rgb, self.boxes[0], self.landmarks)
+        return self._memo("face", _calc)
+
+    @property
+    def qualidade(self) -> Optional[Tuple[bool, dict]]:
+        return self._memo("qualidade", lambda: None if self.face is None else _quality_checks(self.face))
+
+    def encoding(self, num_jitters: int = NUM_JITTERS_CADASTRO) -> Optional[np.ndarray]:
+        """Encoding do recorte, apenas se a qualidade for aceitável."""
+        if num_jitters not in self._encodings:
+            q = self.qualidade
+            self._encodings[num_jitters] = _encode_face(self.face, num_jitters) if q and q[0] else None
+        return self._encodings[num_jitters]
+
+def _analise(imagem: Union[Imagem, AnaliseFacial]) -> AnaliseFacial:
+    return imagem if isinstance(imagem, AnaliseFacial) else AnaliseFacial(imagem)
+
 # ------------------ API pública ------------------
-def validar_qualidade_imagem(imagem_path: str) -> Tuple[bool, str]:
+def validar_qualidade_imagem(imagem: Union[Imagem, AnaliseFacial]) -> Tuple[bool, str]:
     try:
-        rgb = _image_to_rgb(imagem_path)
-        face = _extract_single_face(rgb)
-        if face is None:
+        analise = _analise(imagem)
+        if analise.face is None:
             return False, "Imagem deve conter exatamente um rosto detectável"
-        ok, m = _quality_checks(face)
+        ok, m = analise.qualidade
         if not ok:
             return False, f"Qualidade insuficiente (foco={m['focus']:.1f}, brilho={m['brightness']:.1f}, tamanho={m['w']}x{m['h']})"
         return True, "Imagem válida"
@@ -173,18 +313,13 @@ def validar_qualidade_imagem(imagem_path: str) -> Tuple[bool, str]:
         logger.error("Erro em validar_qualidade_imagem: %s", e, exc_info=True)
         return False, f"Erro ao validar imagem: {e}"
 
-def extrair_biometria_facial(imagem_path: str) -> Optional[np.ndarray]:
+def extrair_biometria_facial(imagem: Union[Imagem, AnaliseFacial],
+                             num_jitters: int = NUM_JITTERS_CADASTRO) -> Optional[np.ndarray]:
+    analise = _analise(imagem)
     try:
-        rgb_img = _image_to_rgb(imagem_path)
-        face_img = _extract_single_face(rgb_img)
-        if face_img is None:
-            return None
-        ok, _ = _quality_checks(face_img)
-        if not ok:
-            return None
-        return _encode_face(face_img)
+        return analise.encoding(num_jitters)
     except Exception as e:
-        logger.error("Falha ao extrair biometria (%s): %s", imagem_path, e, exc_info=True)
+        logger.error("Falha ao extrair biometria (%s): %s", descrever_imagem(analise.imagem), e, exc_info=True)
         return None
 
 def comparar_biometrias(encoding_conhecido: np.ndarray,
@@ -194,67 +329,159 @@ def comparar_biometrias(encoding_conhecido: np.ndarray,
     b = _to_numpy_encoding(encoding_desconhecido)
     if a is None or b is None:
         return False, 0.0
-    dist = float(face_recognition.face_distance(np.expand_dims(a, 0), b)[0])
+    dist = float(get_face_recognition().face_distance(np.expand_dims(a, 0), b)[0])
     conf = _dist_to_conf(dist, tolerancia)
     return (dist <= tolerancia), conf
 
-def reconhecer_motorista_por_id(imagem_path: str, motorista_id: int, tolerancia: float = DEFAULT_TOL) -> Tuple[bool, float]:
+def reconhecer_motorista_por_id(imagem: Imagem, motorista_id: int, tolerancia: float = DEFAULT_TOL) -> Tuple[bool, float]:
     m_obj = Motorista.query.get(motorista_id)
     if not m_obj:
         return False, 0.0
 
-    ref = _to_numpy_encoding(m_obj.get_biometria())
-    if ref is None:
+    # 1:1 contra o template mais próximo (cadastros antigos: a própria biometria)
+    templates = m_obj.get_templates()
+    if templates is None:
         return False, 0.0
 
-    enc_img = extrair_biometria_facial(imagem_path)
+    analise = _analise(imagem)
+    enc_img = extrair_biometria_facial(analise, NUM_JITTERS_CONSULTA)
     if enc_img is None:
         return False, 0.0
 
-    return comparar_biometrias(ref, enc_img, tolerancia)
+    dist = float(np.linalg.norm(templates - enc_img, axis=1).min())
+    if _deve_escalar(dist, tolerancia):
+        enc_esc = extrair_biometria_facial(analise, NUM_JITTERS_ESCALADA)
+        if enc_esc is not None:
+            dist = float(np.linalg.norm(templates - enc_esc, axis=1).min())
+    return (dist <= tolerancia), _dist_to_conf(dist, tolerancia)
 
-def encontrar_correspondencia(encoding_alvo: np.ndarray,
-                              candidatos: List[Tuple[Any, np.ndarray]],
-                              tolerancia: float = DEFAULT_TOL) -> Tuple[Optional[Any], float]:
-    if not candidatos:
-        return None, 0.0
+def _deve_escalar(distancia: float, tolerancia: float) -> bool:
+    """Match ambíguo em torno da tolerância: vale pagar mais jitters para decidir."""
+    return NUM_JITTERS_ESCALADA > NUM_JITTERS_CONSULTA and abs(distancia - tolerancia) <= FAIXA_INCERTEZA
 
-    objs = [c[0] for c in candidatos]
-    vecs = np.stack([_to_numpy_encoding(c[1]) for c in candidatos], axis=0)
-    # Remover candidatos inválidos
-    mask_valid = np.array([v is not None for v in [*map(_to_numpy_encoding, [c[1] for c in candidatos])]], dtype=bool)
-    if not mask_valid.any():
+def _distancias_candidatos(encoding_alvo: np.ndarray,
+                           candidatos: List[Tuple[Any, np.ndarray]]) -> Tuple[List[Any], Optional[np.ndarray]]:
+    """Converte cada candidato uma única vez, descarta os inválidos e calcula as distâncias em lote."""
+    enc_alvo = _to_numpy_encoding(encoding_alvo)
+    if enc_alvo is None or not candidatos:
+        return [], None
+
+    objs: List[Any] = []
+    vecs: List[np.ndarray] = []
+    for obj, raw in candidatos:
+        vec = _to_numpy_encoding(raw)
+        if vec is not None:
+            objs.append(obj)
+            vecs.append(vec)
+    if not vecs:
+        return [], None
+
+    matriz = np.stack(vecs, axis=0).astype(np.float32)
+    return objs, distancias_l2(matriz, np.einsum("ij,ij->i", matriz, matriz), enc_alvo)
+
+def _margem(dists: np.ndarray) -> Optional[float]:
+    """Diferença entre a 2ª e a 1ª menores distâncias (None se houver só um candidato)."""
+    return float(dists[1] - dists[0]) if dists.shape[0] >= 2 else None
+
+def _motorista_da_galeria(id_motorista: Optional[int], best_dist: float,
+                          tolerancia: float) -> Tuple[Optional[Motorista], float]:
+    """Hidrata pelo ORM só o vencedor da galeria, se estiver dentro da tolerância."""
+    if id_motorista is None:
         return None, 0.0
-    vecs = np.stack([_to_numpy_encoding(c[1]) for c in candidatos if _to_numpy_encoding(c[1]) is not None], axis=0)
-    objs = [c[0] for c in candidatos if _to_numpy_encoding(c[1]) is not None]
+    conf = _dist_to_conf(best_dist, tolerancia)
+    return (Motorista.query.get(id_motorista), conf) if best_dist <= tolerancia else (None, conf)
 
-    enc_alvo = _to_numpy_encoding(encoding_alvo)
-    if enc_alvo is None:
+def encontrar_correspondencia(encoding_alvo: np.ndarray,
+                              candidatos: Optional[List[Tuple[Any, np.ndarray]]] = None,
+                              tolerancia: float = DEFAULT_TOL) -> Tuple[Optional[Any], float]:
+    """
+    (match ou None, confiança). Sem `candidatos`, busca na galeria de motoristas
+    (índice IVF quando ativo) e devolve o Motorista; com uma lista explícita de
+    (objeto, encoding), compara só contra ela.
+    """
+    if candidatos is None:
+        enc_alvo = _to_numpy_encoding(encoding_alvo)
+        if enc_alvo is None:
+            return None, 0.0
+        galeria = get_galeria()
+        galeria.sincronizar()
+        return _motorista_da_galeria(*galeria.buscar(enc_alvo, limiar=tolerancia), tolerancia)
+
+    objs, dists = _distancias_candidatos(encoding_alvo, candidatos)
+    if dists is None:
         return None, 0.0
 
-    dists = face_recognition.face_distance(vecs, enc_alvo)
     idx = int(np.argmin(dists))
     best_dist = float(dists[idx])
     conf = _dist_to_conf(best_dist, tolerancia)
     return (objs[idx], conf) if best_dist <= tolerancia else (None, conf)
 
-def reconhecer_motorista_cadastrado(imagem_path: str, tolerancia: float = DEFAULT_TOL) -> Tuple[Optional[Motorista], float]:
+def reconhecer_motorista_cadastrado(imagem: Imagem, tolerancia: float = DEFAULT_TOL) -> Tuple[Optional[Motorista], float]:
     """
-    Identificação 1:N. Itera pela base e escolhe o melhor candidato.
-    Para grandes volumes, substitua por um índice vetorial (FAISS/Milvus/pgvector).
+    Identificação 1:N contra a galeria em memória (matriz float32 N×128 carregada
+    uma vez por processo). Para grandes volumes, FACE_ANN=ivf ativa o índice
+    aproximado com re-ranqueamento exato. Só o motorista vencedor é hidratado pelo ORM.
     """
-    enc_img = extrair_biometria_facial(imagem_path)
+    analise = _analise(imagem)
+    enc_img = extrair_biometria_facial(analise, NUM_JITTERS_CONSULTA)
     if enc_img is None:
         return None, 0.0
 
-    candidatos: List[Tuple[Motorista, np.ndarray]] = []
-    for m in Motorista.query.all():
-        ref = _to_numpy_encoding(m.get_biometria())
-        if ref is not None:
-            candidatos.append((m, ref))
+    galeria = get_galeria()
+    galeria.sincronizar()
+    id_motorista, best_dist = galeria.buscar(enc_img, limiar=tolerancia)
+    if id_motorista is not None and _deve_escalar(best_dist, tolerancia):
+        enc_img = extrair_biometria_facial(analise, NUM_JITTERS_ESCALADA)
+        if enc_img is not None:
+            id_motorista, best_dist = galeria.buscar(enc_img, limiar=tolerancia)
+    return _motorista_da_galeria(id_motorista, best_dist, tolerancia)
 
-    if not candidatos:
-        return None, 0.0
+def reconhecer_motorista_top_k(imagem: Imagem, k: int = 3, tolerancia: float = DEFAULT_TOL) -> Dict[str, Any]:
+    """
+    Identificação 1:N em modo top-k. Retorna os k candidatos mais próximos com
+    distância/confiança e a margem entre o 1º e o 2º. `aceite_automatico` indica
+    match dentro da tolerância e sem empate próximo (margem >= FACE_MARGEM_MIN).
+    """
+    k = max(1, min(int(k), TOP_K_MAX))
+    resp: Dict[str, Any] = {"candidatos": [], "margem": None, "ambiguo": False,
+                            "aceite_automatico": False, "escalado": False}
 
-    obj, conf = encontrar_correspondencia(enc_img, candidatos, tolerancia)
-    return obj, conf
+    analise = _analise(imagem)
+    enc_img = extrair_biometria_facial(analise, NUM_JITTERS_CONSULTA)
+    if enc_img is None:
+        return resp
+
+    galeria = get_galeria()
+    galeria.sincronizar()
+    # pede um vizinho a mais para que a margem exista mesmo com k=1
+    ids, dists = galeria.buscar_top_k(enc_img, max(k, 2), limiar=tolerancia)
+    if ids.shape[0] == 0:
+        return resp
+    if _deve_escalar(float(dists[0]), tolerancia):
+        enc_esc = extrair_biometria_facial(analise, NUM_JITTERS_ESCALADA)
+        if enc_esc is not None:
+            ids, dists = galeria.buscar_top_k(enc_esc, max(k, 2), limiar=tolerancia)
+            resp["escalado"] = True
+
+    nomes = dict(
+        Motorista.query
+        .with_entities(Motorista.id_motorista, Motorista.nome)
+        .filter(Motorista.id_motorista.in_([int(i) for i in ids[:k]]))
+        .all()
+    )
+    resp["candidatos"] = [
+        {
+            "id_motorista": int(i),
+            "nome": nomes.get(int(i)),
+            "distancia": round(float(d), 4),
+            "confianca": round(_dist_to_conf(float(d), tolerancia), 4),
+        }
+        for i, d in zip(ids[:k], dists[:k])
+    ]
+
+    margem = _margem(dists)
+    dentro = float(dists[0]) <= tolerancia
+    resp["margem"] = None if margem is None else round(margem, 4)
+    resp["ambiguo"] = bool(dentro and margem is not None and margem < MARGEM_MIN)
+    resp["aceite_automatico"] = bool(dentro and not resp["ambiguo"])
+    return resp
@@ -0,0 +1,32 @@
+# app/utils/image_io.py
+import cv2
+import numpy as np
+from typing import Union
+from werkzeug.datastructures import FileStorage
+
+# Caminho em disco ou imagem já decodificada (BGR, como devolvido por cv2.imread/imdecode)
+Imagem = Union[str, np.ndarray]
+
+
+def decodificar_upload(fs: FileStorage) -> np.ndarray:
+    """Decodifica o upload direto do stream em memória (sem arquivo temporário)."""
+    buf = np.frombuffer(fs.stream.read(), dtype=np.uint8)
+    bgr = cv2.imdecode(buf, cv2.IMREAD_COLOR) if buf.size else None
+    if bgr is None:
+        raise ValueError(f"Não foi possível decodificar a imagem enviada ({fs.filename})")
+    return bgr
+
+def carregar_bgr(imagem: Imagem) -> np.ndarray:
+    """Aceita caminho ou ndarray BGR; sempre devolve ndarray BGR."""
+    if isinstance(imagem, np.ndarray):
+        return imagem
+    bgr = cv2.imread(imagem)
+    if bgr is None:
+        raise ValueError(f"Não foi possível ler a imagem em: {imagem}")
+    return bgr
+
+def descrever_imagem(imagem: Imagem) -> str:
+    """Texto curto para logs (evita despejar o array inteiro)."""
+    if isinstance(imagem, np.ndarray):
+        return f"<ndarray {imagem.shape[1]}x{imagem.shape[0]}>"
+    return str(imagem)
@@ -0,0 +1,28 @@
+# app/utils/memory_report.py
+import os
+import resource
+from typing import Dict, Any
+
+_CAMPOS_SMAPS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+
+
+def relatorio_memoria() -> Dict[str, Any]:
+    """
+    Uso de memória do processo atual, em MB.
+    Em Linux lê /proc/self/smaps_rollup: `pss` divide as páginas compartilhadas
+    (copy-on-write com o master do gunicorn) entre os processos que as usam, e
+    `private` é o que o worker realmente acrescenta.
+    """
+    rel: Dict[str, Any] = {"pid": os.getpid(), "ppid": os.getppid()}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for linha in f:
+                chave, _, resto = linha.partition(":")
+                if chave in _CAMPOS_SMAPS:
+                    rel[chave.lower() + "_mb"] = round(int(resto.split()[0]) / 1024, 1)
+        rel["shared_mb"] = round(rel.get("shared_clean_mb", 0) + rel.get("shared_dirty_mb", 0), 1)
+        rel["private_mb"] = round(rel.get("private_clean_mb", 0) + rel.get("private_dirty_mb", 0), 1)
+    except OSError:
+        # fora do Linux: apenas o pico de RSS (KB no Linux/BSD, bytes no macOS)
+        rel["max_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rel
@@ -0,0 +1,88 @@
+# app/utils/model_loader.py
+import os
+import time
+import logging
+import threading
+from typing import Any, Dict, Iterable
+
+logger = logging.getLogger(__name__)
+
+# Estados possíveis de cada modelo
+PENDENTE = "pendente"
+CARREGANDO = "carregando"
+PRONTO = "pronto"
+ERRO = "erro"
+
+MODELOS = ("face", "ocr")
+
+_modelos: Dict[str, Any] = {}
+_estado: Dict[str, Dict[str, Any]] = {nome: {"estado": PENDENTE} for nome in MODELOS}
+_locks = {nome: threading.Lock() for nome in MODELOS}
+
+
+# ------------------ Carregadores ------------------
+def _carregar_face() -> Any:
+    # import tardio: `face_recognition` carrega o dlib e os preditores no import
+    import face_recognition
+    return face_recognition
+
+def _carregar_ocr() -> Any:
+    import easyocr
+    langs = os.getenv("PLATE_OCR_LANGS", "pt").split(",")
+    use_gpu = os.getenv("PLATE_OCR_GPU", "false").lower() == "true"
+    return easyocr.Reader(langs, gpu=use_gpu)
+
+_CARREGADORES = {"face": _carregar_face, "ocr": _carregar_ocr}
+
+
+def _obter(nome: str) -> Any:
+    """Carrega o modelo no primeiro uso (thread-safe) e o reutiliza no processo."""
+    modelo = _modelos.get(nome)
+    if modelo is not None:
+        return modelo
+    with _locks[nome]:
+        modelo = _modelos.get(nome)
+        if modelo is not None:
+            return modelo
+        _estado[nome] = {"estado": CARREGANDO}
+        t0 = time.monotonic()
+        try:
+            modelo = _CARREGADORES[nome]()
+        except Exception as e:
+            _estado[nome] = {"estado": ERRO, "erro": str(e)}
+            logger.error("Falha ao carregar modelo %s: %s", nome, e, exc_info=True)
+            raise
+        _modelos[nome] = modelo
+        _estado[nome] = {"estado": PRONTO, "tempo_carga_s": round(time.monotonic() - t0, 2)}
+        logger.info("Modelo %s carregado em %.2fs", nome, time.monotonic() - t0)
+        return modelo
+
+
+# ------------------ API pública ------------------
+def get_face_recognition() -> Any:
+    """Módulo `face_recognition` (dlib), importado sob demanda."""
+    return _obter("face")
+
+def get_ocr_reader() -> Any:
+    """Singleton do `easyocr.Reader`, construído sob demanda."""
+    return _obter("ocr")
+
+def aquecer_modelos(nomes: Iterable[str] = MODELOS) -> None:
+    """Carrega os modelos de forma síncrona; falhas ficam registradas em `estado_modelos()`."""
+    for nome in nomes:
+        try:
+            _obter(nome)
+        except Exception:
+            continue
+
+def iniciar_aquecimento(nomes: Iterable[str] = MODELOS) -> threading.Thread:
+    """Dispara o carregamento em background para não atrasar o boot do worker."""
+    t = threading.Thread(target=aquecer_modelos, args=(tuple(nomes),), name="aquecimento-modelos", daemon=True)
+    t.start()
+    return t
+
+def estado_modelos() -> Dict[str, Dict[str, Any]]:
+    return {nome: dict(info) for nome, info in _estado.items()}
+
+def modelos_prontos() -> bool:
+    return all(info["estado"] == PRONTO for info in _estado.values())
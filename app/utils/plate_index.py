@@ -0,0 +1,169 @@
+# app/utils/plate_index.py
+import os
+import re
+import logging
+import threading
+from itertools import combinations
+from sqlalchemy import func
+from typing import Dict, Set, Optional, Tuple, List
+
+from app.models import Caminhao
+from app.utils.plate_utils import AMBIG_MAP_LETTER, AMBIG_MAP_DIGIT
+
+MAX_DIST = int(os.getenv("PLATE_FUZZY_MAX_DIST", "2"))
+# custo de substituição entre caracteres que o OCR costuma confundir (O/0, I/1, ...)
+CUSTO_CONFUSAO = float(os.getenv("PLATE_FUZZY_CUSTO_CONFUSAO", "0.5"))
+
+logger = logging.getLogger(__name__)
+
+_CONFUSOES: Set[Tuple[str, str]] = set()
+for _a, _b in list(AMBIG_MAP_LETTER.items()) + list(AMBIG_MAP_DIGIT.items()):
+    _CONFUSOES.add((_a, _b))
+    _CONFUSOES.add((_b, _a))
+
+# ------------------ Utils internos ------------------
+def _normaliza(placa: str) -> str:
+    return re.sub(r'[^A-Z0-9]', '', (placa or '').upper())
+
+def _delecoes(txt: str, max_dist: int) -> Set[str]:
+    """Vizinhança de deleção: todas as variantes com até `max_dist` caracteres removidos."""
+    out = {txt}
+    for d in range(1, min(max_dist, len(txt)) + 1):
+        for pos in combinations(range(len(txt)), d):
+            out.add("".join(c for i, c in enumerate(txt) if i not in pos))
+    return out
+
+def distancia_ponderada(a: str, b: str) -> float:
+    """Levenshtein com substituição mais barata para os pares de confusão do OCR."""
+    prev = [float(j) for j in range(len(b) + 1)]
+    for i, ca in enumerate(a, start=1):
+        cur = [float(i)] + [0.0] * len(b)
+        for j, cb in enumerate(b, start=1):
+            if ca == cb:
+                sub = 0.0
+            elif (ca, cb) in _CONFUSOES:
+                sub = CUSTO_CONFUSAO
+            else:
+                sub = 1.0
+            cur[j] = min(prev[j] + 1.0, cur[j - 1] + 1.0, prev[j - 1] + sub)
+        prev = cur
+    return prev[-1]
+
+# ------------------ Índice ------------------
+class IndicePlacas:
+    """
+    Índice em memória das placas de `tb_caminhoes` para busca aproximada
+    (distância de edição até PLATE_FUZZY_MAX_DIST). Usa vizinhança de deleção:
+    cada placa é indexada por todas as suas variantes com até d caracteres
+    removidos; duas strings a distância <= d compartilham alguma variante.
+    Os candidatos são então ordenados pela distância ponderada.
+
+    Invalidação igual à galeria facial: carimbo max(id_caminhao) por consulta
+    e inserção direta via `adicionar()` após o cadastro.
+    """
+
+    def __init__(self, max_dist: int = MAX_DIST):
+        self.max_dist = max_dist
+        self._lock = threading.Lock()
+        self._placas: Dict[str, int] = {}
+        self._vizinhanca: Dict[str, Set[str]] = {}
+        self._max_id_visto = 0
+        self._carregado = False
+
+    @property
+    def tamanho(self) -> int:
+        return len(self._placas)
+
+    def _indexar(self, id_caminhao: int, placa: str) -> None:
+        placa = _normaliza(placa)
+        if not placa or placa in self._placas:
+            return
+        self._placas[placa] = int(id_caminhao)
+        for chave in _delecoes(placa, self.max_dist):
+            self._vizinhanca.setdefault(chave, set()).add(placa)
+
+    def _carimbo_banco(self) -> int:
+        return int(Caminhao.query.with_entities(func.max(Caminhao.id_caminhao)).scalar() or 0)
+
+    def _ler_linhas(self, acima_de: int = 0) -> List[Tuple[int, str]]:
+        return (
+            Caminhao.query
+            .with_entities(Caminhao.id_caminhao, Caminhao.placa)
+            .filter(Caminhao.id_caminhao > acima_de)
+            .order_by(Caminhao.id_caminhao)
+            .all()
+        )
+
+    def carregar(self) -> None:
+        with self._lock:
+            carimbo = self._carimbo_banco()
+            self._placas, self._vizinhanca = {}, {}
+            for id_caminhao, placa in self._ler_linhas():
+                self._indexar(id_caminhao, placa)
+            self._max_id_visto = carimbo
+            self._carregado = True
+            logger.info("Índice de placas carregado: %d placas", self.tamanho)
+
+    def sincronizar(self) -> None:
+        """Verificação barata por requisição: carrega só os caminhões acima do último carimbo."""
+        if not self._carregado:
+            self.carregar()
+            return
+        carimbo = self._carimbo_banco()
+        if carimbo <= self._max_id_visto:
+            return
+        with self._lock:
+            if carimbo <= self._max_id_visto:
+                return
+            for id_caminhao, placa in self._ler_linhas(acima_de=self._max_id_visto):
+                self._indexar(id_caminhao, placa)
+            self._max_id_visto = carimbo
+
+    def adicionar(self, id_caminhao: int, placa: str) -> None:
+        """Insere uma placa recém-commitada sem recarregar o índice."""
+        with self._lock:
+            if not self._carregado:
+                # a primeira consulta fará a carga completa, incluindo este id
+                return
+            self._indexar(id_caminhao, placa)
+
+    def candidatos(self, placa: str, max_dist: Optional[int] = None) -> List[Tuple[str, int, float]]:
+        """[(placa, id_caminhao, distância)] com distância <= max_dist, do mais próximo ao mais distante."""
+        max_dist = self.max_dist if max_dist is None else min(max_dist, self.max_dist)
+        alvo = _normaliza(placa)
+        if not alvo:
+            return []
+        vistos: Set[str] = set()
+        with self._lock:
+            for chave in _delecoes(alvo, max_dist):
+                vistos |= self._vizinhanca.get(chave, set())
+        out = []
+        placas = self._placas
+        for p in vistos:
+            d = distancia_ponderada(alvo, p)
+            if d <= max_dist and p in placas:
+                out.append((p, placas[p], d))
+        out.sort(key=lambda t: t[2])
+        return out
+
+    def buscar(self, placa: str, max_dist: Optional[int] = None) -> Optional[Tuple[int, str, float]]:
+        """
+        Melhor correspondência (id_caminhao, placa, distância). Retorna None se não
+        houver candidato ou se os dois melhores empatarem (evita escolher o caminhão errado).
+        """
+        cands = self.candidatos(placa, max_dist)
+        if not cands:
+            return None
+        if len(cands) > 1 and cands[1][2] == cands[0][2]:
+            return None
+        p, id_caminhao, d = cands[0]
+        return id_caminhao, p, d
+
+
+# Singleton do índice (um por processo)
+_INDICE = None
+def get_indice_placas() -> IndicePlacas:
+    global _INDICE
+    if _INDICE is None:
+        _INDICE = IndicePlacas()
+    return _INDICE
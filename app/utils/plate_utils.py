@@ -3,20 +3,31 @@ import os
 import re
 import cv2
 import numpy as np
-import easyocr
 from typing import Optional, Tuple, List, Dict
 
+from app.utils.model_loader import get_ocr_reader
+from app.utils.image_io import Imagem, carregar_bgr
+
 PADRAO_PLACA_BR = re.compile(r'^[A-Z]{3}[0-9][A-Z0-9][0-9]{2}$')
+OCR_ALLOWLIST = "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+OCR_BATCH_SIZE = int(os.getenv("PLATE_OCR_BATCH", "8"))   # recortes por lote no reconhecedor
+
+# Localização clássica de ROIs antes do OCR (bordas + morfologia)
+ROI_ATIVO = os.getenv("PLATE_ROI", "true").lower() == "true"
+ROI_MAX_REGIOES = int(os.getenv("PLATE_ROI_MAX", "3"))
+ROI_ALTURA_MIN_OCR = int(os.getenv("PLATE_ROI_MIN_H", "64"))  # recortes menores são ampliados
+
+# Modo estagiado: passe rápido (baixa resolução, só CLAHE) e escalonamento para o
+# pipeline completo apenas se nenhum candidato válido atingir PLATE_SCORE_SAIDA
+ESTAGIADO = os.getenv("PLATE_ESTAGIADO", "true").lower() == "true"
+RAPIDO_MAX_W = int(os.getenv("PLATE_RAPIDO_MAX_W", "800"))
+SCORE_SAIDA = float(os.getenv("PLATE_SCORE_SAIDA", "0.6"))
+# placa válida achada só nas ROIs dispensa o frame inteiro a partir deste score
+ROI_SCORE_MIN = float(os.getenv("PLATE_ROI_SCORE_MIN", str(SCORE_SAIDA)))
 
-# Singleton do OCR
-_OCR = None
+# Singleton do OCR (carregado sob demanda pelo model_loader)
 def _get_reader():
-    global _OCR
-    if _OCR is None:
-        langs = os.getenv("PLATE_OCR_LANGS", "pt").split(",")
-        use_gpu = os.getenv("PLATE_OCR_GPU", "false").lower() == "true"
-        _OCR = easyocr.Reader(langs, gpu=use_gpu)
-    return _OCR
+    return get_ocr_reader()
 
 
 def _clahe_gray(gray: np.ndarray) -> np.ndarray:
@@ -34,16 +45,28 @@ def _resize_limit(img: np.ndarray, max_w: int = 1280) -> np.ndarray:
     scale = max_w / w
     return cv2.resize(img, (int(w*scale), int(h*scale)), interpolation=cv2.INTER_AREA)
 
-def preprocessar_imagem(imagem_path: str) -> np.ndarray:
-    bgr = cv2.imread(imagem_path)
-    if bgr is None:
+def _ler_bgr(imagem: Imagem) -> np.ndarray:
+    try:
+        return carregar_bgr(imagem)
+    except ValueError:
         raise ValueError("Imagem inválida ou caminho inexistente.")
-    bgr = _resize_limit(bgr)
+
+def _preprocessar_bgr(bgr: np.ndarray, rapido: bool = False) -> np.ndarray:
+    """
+    Pipeline completo: resize 1280 + CLAHE + bilateral + unsharp.
+    `rapido`: resolução menor (PLATE_RAPIDO_MAX_W) e só CLAHE.
+    """
+    bgr = _resize_limit(bgr, RAPIDO_MAX_W if rapido else 1280)
     gray = cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY)
     gray = _clahe_gray(gray)
+    if rapido:
+        return gray
     gray = cv2.bilateralFilter(gray, 7, 60, 60)
     gray = _unsharp(gray)
-    return gray  # ndarray, sem arquivo temporário
+    return gray
+
+def preprocessar_imagem(imagem: Imagem, rapido: bool = False) -> np.ndarray:
+    return _preprocessar_bgr(_ler_bgr(imagem), rapido)  # ndarray, sem arquivo temporário
 
 
 
@@ -85,52 +108,200 @@ def _candidate_score(text_conf: float, area_frac: float, asp_score: float, regex
     return float(score)
 
 
-def reconhecer_placa(imagem_path: str, debug: bool = False) -> Optional[str]:
+def _propor_regioes_placa(gray: np.ndarray, max_regioes: int = ROI_MAX_REGIOES) -> List[Tuple[int, int, int, int]]:
+    """
+    Propõe regiões com formato de placa (~4:1) sem OCR: black-hat realça caracteres
+    escuros sobre fundo claro, Sobel-x pega as transições verticais dos caracteres e
+    o fechamento morfológico funde a linha de texto num retângulo.
+    Retorna caixas (x, y, w, h) já com margem, da mais para a menos provável.
+    """
+    H, W = gray.shape[:2]
+    rect_k = cv2.getStructuringElement(cv2.MORPH_RECT, (13, 5))
+    blackhat = cv2.morphologyEx(gray, cv2.MORPH_BLACKHAT, rect_k)
+
+    grad = cv2.Sobel(blackhat, cv2.CV_32F, 1, 0, ksize=-1)
+    grad = np.absolute(grad)
+    grad = cv2.normalize(grad, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
+    grad = cv2.GaussianBlur(grad, (5, 5), 0)
+    grad = cv2.morphologyEx(grad, cv2.MORPH_CLOSE, rect_k)
+    _, bw = cv2.threshold(grad, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    bw = cv2.morphologyEx(bw, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (21, 7)))
+    bw = cv2.erode(bw, None, iterations=2)
+    bw = cv2.dilate(bw, None, iterations=2)
+
+    contornos, _ = cv2.findContours(bw, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    propostas = []
+    for c in contornos:
+        x, y, w, h = cv2.boundingRect(c)
+        if h < 12:
+            continue
+        asp = _aspect_score(w, h)
+        area_frac = float(w * h) / float(W * H)
+        if asp <= 0.0 or not (0.001 <= area_frac <= 0.3):
+            continue
+        propostas.append((asp * min(1.0, area_frac * 50), (x, y, w, h)))
+
+    propostas.sort(key=lambda p: p[0], reverse=True)
+    caixas = []
+    for _, (x, y, w, h) in propostas[:max_regioes]:
+        mx, my = int(w * 0.15), int(h * 0.35)
+        x0, y0 = max(0, x - mx), max(0, y - my)
+        x1, y1 = min(W, x + w + mx), min(H, y + h + my)
+        caixas.append((x0, y0, x1 - x0, y1 - y0))
+    return caixas
+
+def _ocr_regiao(reader, gray: np.ndarray, caixa: Tuple[int, int, int, int]) -> list:
+    """OCR de um recorte; as bbox voltam em coordenadas do frame inteiro."""
+    x, y, w, h = caixa
+    crop = gray[y:y + h, x:x + w]
+    f = max(1.0, ROI_ALTURA_MIN_OCR / float(h))
+    if f > 1.0:
+        crop = cv2.resize(crop, (int(w * f), int(h * f)), interpolation=cv2.INTER_CUBIC)
+    results = reader.readtext(crop, allowlist=OCR_ALLOWLIST, detail=1, paragraph=False)
+    return [
+        ([(px / f + x, py / f + y) for px, py in bbox], texto, conf)
+        for bbox, texto, conf in results
+    ]
+
+def _placa_valida(placa: Optional[str]) -> bool:
+    return bool(placa and PADRAO_PLACA_BR.fullmatch(placa))
+
+def _melhor_candidato(results, H: int, W: int, debug: bool = False,
+                      score_saida: Optional[float] = None) -> Tuple[Optional[str], float]:
+    """
+    Pontua os resultados do EasyOCR de um frame e devolve (placa, score) do melhor.
+    Com `score_saida`, para no primeiro candidato válido pela regex que o atinja.
+    """
+    best = {"placa": None, "score": 0.0}
+
+    for bbox, texto, conf in results:
+        texto_limpo = re.sub(r'[^A-Z0-9]', '', texto.upper())
+        # bbox: 4 pontos (x,y)
+        x0, y0 = bbox[0]
+        x2, y2 = bbox[2]
+        w = abs(x2 - x0)
+        h = abs(y2 - y0)
+        area = w * h
+        area_frac = float(area) / float(W * H)
+        asp = _aspect_score(w, h)
+
+        txt_corr = _corrigir_ambig_posicional(texto_limpo)
+        regex_ok = bool(PADRAO_PLACA_BR.fullmatch(txt_corr))
+        score = _candidate_score(conf, area_frac, asp, regex_ok)
+
+        if debug:
+            print(f"[conf={conf:.2f}] {texto} -> {txt_corr} | asp={asp:.2f} | area%={area_frac*100:.2f} | score={score:.3f}")
+
+        if score > best["score"]:
+            best = {"placa": txt_corr, "score": score}
+            if score_saida is not None and regex_ok and score >= score_saida:
+                break
+
+    return best["placa"], best["score"]
+
+
+def _ocr_pipeline(reader, gray: np.ndarray, debug: bool = False,
+                  score_saida: Optional[float] = None,
+                  frame_inteiro: bool = True) -> Tuple[Optional[str], float]:
+    """ROIs primeiro (com saída antecipada) e, se preciso, OCR no frame inteiro."""
+    H, W = gray.shape[:2]
+
+    # 1) OCR apenas nas regiões com formato de placa
+    best_placa, best_score = None, 0.0
+    if ROI_ATIVO:
+        for caixa in _propor_regioes_placa(gray):
+            placa, score = _melhor_candidato(_ocr_regiao(reader, gray, caixa), H, W, debug, score_saida)
+            if score > best_score:
+                best_placa, best_score = placa, score
+            if score_saida is not None and _placa_valida(placa) and score >= score_saida:
+                return placa, score
+        if _placa_valida(best_placa) and best_score >= ROI_SCORE_MIN:
+            return best_placa, best_score
+        if debug:
+            print(f"ROI sem placa válida confiável ({best_placa}, score={best_score:.3f})")
+
+    if not frame_inteiro:
+        return best_placa, best_score
+
+    # 2) fallback: frame inteiro (permitir apenas A-Z0-9)
+    results = reader.readtext(gray, allowlist=OCR_ALLOWLIST, detail=1, paragraph=False)
+    placa, score = _melhor_candidato(results, H, W, debug, score_saida)
+    # placa válida da ROI não perde para texto inválido do frame inteiro
+    if _placa_valida(best_placa) and not _placa_valida(placa):
+        return best_placa, best_score
+    return (placa, score) if score >= best_score else (best_placa, best_score)
+
+
+def reconhecer_placa(imagem: Imagem, debug: bool = False, estagiado: bool = ESTAGIADO) -> Optional[str]:
     try:
-        gray = preprocessar_imagem(imagem_path)
+        bgr = _ler_bgr(imagem)
         reader = _get_reader()
-        # permitir apenas A-Z0-9
-        results = reader.readtext(gray, allowlist="ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789", detail=1, paragraph=False)
-
-        H, W = gray.shape[:2]
-        best = {"placa": None, "score": 0.0}
-
-        for bbox, texto, conf in results:
-            texto_limpo = re.sub(r'[^A-Z0-9]', '', texto.upper())
-            # bbox: 4 pontos (x,y)
-            x0, y0 = bbox[0]
-            x2, y2 = bbox[2]
-            w = abs(x2 - x0)
-            h = abs(y2 - y0)
-            area = w * h
-            area_frac = float(area) / float(W * H)
-            asp = _aspect_score(w, h)
-
-            txt_corr = _corrigir_ambig_posicional(texto_limpo)
-            regex_ok = bool(PADRAO_PLACA_BR.fullmatch(txt_corr))
-            score = _candidate_score(conf, area_frac, asp, regex_ok)
 
+        if estagiado:
+            # passe rápido; sem ROI ativa, o próprio frame inteiro é o passe rápido
+            gray = _preprocessar_bgr(bgr, rapido=True)
+            placa, score = _ocr_pipeline(reader, gray, debug, SCORE_SAIDA, frame_inteiro=not ROI_ATIVO)
+            if _placa_valida(placa) and score >= SCORE_SAIDA:
+                return placa
             if debug:
-                print(f"[conf={conf:.2f}] {texto} -> {txt_corr} | asp={asp:.2f} | area%={area_frac*100:.2f} | score={score:.3f}")
+                print(f"Passe rápido insuficiente ({placa}, score={score:.3f}); pipeline completo")
 
-            if score > best["score"]:
-                best = {"placa": txt_corr, "score": score}
-
-        return best["placa"]
+        placa, _ = _ocr_pipeline(reader, _preprocessar_bgr(bgr), debug)
+        return placa
     except Exception as e:
         if debug:
             print("Erro ao reconhecer placa:", e)
         return None
 
 
-def reconhecer_placa_multiframe(imagens_paths: List[str]) -> Optional[str]:
-    """Agrega múltiplas leituras por voto majoritário simples."""
-    votos: Dict[str, int] = {}
-    for p in imagens_paths:
-        placa = reconhecer_placa(p, debug=False)
+def _readtext_lote(grays: List[np.ndarray]) -> List[list]:
+    """
+    Roda detecção + reconhecimento de todos os frames numa única chamada em lote.
+    Os frames são completados com borda preta (à direita/abaixo) até o mesmo tamanho,
+    o que mantém as coordenadas das bbox iguais às do frame original.
+    """
+    reader = _get_reader()
+    Hm = max(g.shape[0] for g in grays)
+    Wm = max(g.shape[1] for g in grays)
+    lote = [
+        cv2.copyMakeBorder(g, 0, Hm - g.shape[0], 0, Wm - g.shape[1], cv2.BORDER_CONSTANT, value=0)
+        for g in grays
+    ]
+    return reader.readtext_batched(
+        lote, allowlist=OCR_ALLOWLIST, detail=1, paragraph=False, batch_size=OCR_BATCH_SIZE
+    )
+
+
+def reconhecer_placa_multiframe(imagens: List[Imagem], debug: bool = False) -> Optional[str]:
+    """
+    Pré-processa todos os frames, roda o OCR em lote e agrega por voto ponderado:
+    cada frame vota no seu melhor candidato com peso igual ao `_candidate_score`.
+    """
+    grays: List[np.ndarray] = []
+    for p in imagens:
+        try:
+            grays.append(preprocessar_imagem(p))
+        except ValueError as e:
+            if debug:
+                print("Frame ignorado:", e)
+    if not grays:
+        return None
+
+    try:
+        resultados = _readtext_lote(grays)
+    except Exception as e:
+        if debug:
+            print("OCR em lote falhou, processando frame a frame:", e)
+        reader = _get_reader()
+        resultados = [reader.readtext(g, allowlist=OCR_ALLOWLIST, detail=1, paragraph=False) for g in grays]
+
+    votos: Dict[str, float] = {}
+    for gray, results in zip(grays, resultados):
+        H, W = gray.shape[:2]
+        placa, score = _melhor_candidato(results, H, W, debug)
         if not placa:
             continue
-        votos[placa] = votos.get(placa, 0) + 1
+        votos[placa] = votos.get(placa, 0.0) + score
     if not votos:
         return None
     return max(votos.items(), key=lambda kv: kv[1])[0]
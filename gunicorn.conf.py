@@ -0,0 +1,78 @@
+# gunicorn.conf.py
+import os
+import sys
+import time
+import logging
+import threading
+import subprocess
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', '2'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+# threads > 1 ativa o worker gthread: cada tela conectada em /api/balanca/peso/stream
+# ocupa uma thread, não o worker inteiro (parada num Condition, sem custo de CPU).
+# Os streams por worker são limitados a BALANCA_STREAM_MAX_CLIENTES (padrão:
+# GUNICORN_THREADS - 4; 503 acima disso), para sobrar thread para a API.
+threads = int(os.getenv('GUNICORN_THREADS', '16'))
+
+# Balanças: cada worker com o próprio leitor abriria a mesma porta serial e os
+# ENQs de um rasgariam os quadros do outro. Com mais de um worker, um único
+# processo filho do master é dono das portas (app.hardware.tc420_servidor) e os
+# workers assinam as leituras por socket unix (BALANCA_SOCKET).
+if workers > 1:
+    os.environ.setdefault('BALANCA_LEITOR', 'processo')
+
+# Carrega a aplicação (e, com MODELS_PRELOAD=true, os pesos do dlib/EasyOCR) uma
+# única vez no master; os workers herdam as páginas por copy-on-write após o fork.
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+# Com preload o create_app roda no master: uma thread de aquecimento iniciada ali
+# (MODELS_WARMUP) poderia estar segurando o lock do modelo no fork, e o worker
+# herdaria o lock travado sem dono. O aquecimento fica para post_worker_init.
+if preload_app:
+    os.environ['MODELS_WARMUP_POS_FORK'] = 'true'
+
+
+def post_worker_init(worker):
+    from app.utils.memory_report import relatorio_memoria
+    from app.main import aquecimento_em_background
+    if preload_app and aquecimento_em_background():
+        from app.utils.model_loader import iniciar_aquecimento
+        iniciar_aquecimento()
+    logging.getLogger('gunicorn.error').info('[worker %s] memória: %s', worker.pid, relatorio_memoria())
+
+
+_servidor_balancas = None
+_encerrando = threading.Event()
+
+
+def _manter_servidor_balancas(log):
+    """Mantém o tc420_servidor vivo enquanto o master roda (reinicia se cair)."""
+    global _servidor_balancas
+    espera = 1.0
+    while not _encerrando.is_set():
+        inicio = time.monotonic()
+        _servidor_balancas = subprocess.Popen([sys.executable, '-m', 'app.hardware.tc420_servidor'])
+        log.info('Servidor de balanças iniciado (pid %s)', _servidor_balancas.pid)
+        codigo = _servidor_balancas.wait()
+        if _encerrando.is_set():
+            break
+        espera = 1.0 if time.monotonic() - inicio > 60 else min(espera * 2, 30.0)
+        log.warning('Servidor de balanças saiu (código %s); reiniciando em %.0fs', codigo, espera)
+        _encerrando.wait(espera)
+
+
+def when_ready(server):
+    if os.environ.get('BALANCA_LEITOR') == 'processo':
+        threading.Thread(target=_manter_servidor_balancas, args=(server.log,),
+                         name='servidor-balancas', daemon=True).start()
+
+
+def on_exit(server):
+    _encerrando.set()
+    if _servidor_balancas is not None and _servidor_balancas.poll() is None:
+        _servidor_balancas.terminate()
+        try:
+            _servidor_balancas.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            _servidor_balancas.kill()
@@ -0,0 +1,29 @@
+"""templates de biometria por motorista (centróide + raio)
+
+Revision ID: a1f3c9d27e10
+Revises:
+Create Date: 2026-10-18 09:12:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a1f3c9d27e10'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # sem backfill: get_templates() usa a própria `biometria` quando a coluna é nula
+    with op.batch_alter_table('tb_motoristas', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('biometria_templates', sa.LargeBinary(), nullable=True))
+        batch_op.add_column(sa.Column('raio_biometria', sa.Float(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('tb_motoristas', schema=None) as batch_op:
+        batch_op.drop_column('raio_biometria')
+        batch_op.drop_column('biometria_templates')
@@ -0,0 +1,36 @@
+"""agregados diários de pesagem
+
+Revision ID: b7d41e0c5a92
+Revises: a1f3c9d27e10
+Create Date: 2026-10-18 14:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d41e0c5a92'
+down_revision = 'a1f3c9d27e10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # carga inicial (após a revisão de timestamps): flask --app run recalcular-agregados
+    op.create_table(
+        'tb_agregados_pesagem',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('dia', sa.Date(), nullable=False),
+        sa.Column('dimensao', sa.String(length=16), nullable=False),
+        sa.Column('chave', sa.Text(), nullable=False),
+        sa.Column('ciclos', sa.Integer(), nullable=False),
+        sa.Column('peso_liquido_total', sa.Float(), nullable=False),
+        sa.Column('peso_liquido_n', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('dia', 'dimensao', 'chave', name='uq_agregados_pesagem_dia_dimensao_chave'),
+    )
+
+
+def downgrade():
+    op.drop_table('tb_agregados_pesagem')
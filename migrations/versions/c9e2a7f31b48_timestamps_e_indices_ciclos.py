@@ -0,0 +1,112 @@
+"""timestamps com fuso nos ciclos/pesagens e índices das buscas críticas
+
+Revision ID: c9e2a7f31b48
+Revises: b7d41e0c5a92
+Create Date: 2026-10-18 18:05:00.000000
+
+"""
+from datetime import date
+
+from alembic import op, context
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c9e2a7f31b48'
+down_revision = 'b7d41e0c5a92'
+branch_labels = None
+depends_on = None
+
+
+def _data_base():
+    """
+    Dia usado quando o ciclo não tem registro de reconhecimento com data:
+        flask --app run db upgrade -x data_base=AAAA-MM-DD   (padrão: current_date)
+    """
+    valor = context.get_x_argument(as_dictionary=True).get('data_base')
+    return f"DATE '{date.fromisoformat(valor).isoformat()}'" if valor else "current_date"
+
+
+def upgrade():
+    base = _data_base()
+
+    # --- ciclos_pesagem: TIME -> TIMESTAMPTZ (colunas novas, backfill, troca) ---
+    op.add_column('ciclos_pesagem', sa.Column('data_entrada_ts', sa.DateTime(timezone=True), nullable=True))
+    op.add_column('ciclos_pesagem', sa.Column('data_saida_ts', sa.DateTime(timezone=True), nullable=True))
+
+    # a data vem do registro de reconhecimento do ciclo (data_hora é TIMESTAMP);
+    # sem registro, usa a data base. A saída herda a data da entrada e avança um
+    # dia quando o horário é menor (ciclo atravessou a meia-noite).
+    op.execute(f"""
+        UPDATE ciclos_pesagem c
+           SET data_entrada_ts = (
+                   COALESCE(
+                       (SELECT min(r.data_hora)::date FROM tb_registros_reconhecimento r
+                         WHERE r.ciclo_id = c.id_pesagem AND r.tipo_operacao = 'entrada'),
+                       {base}
+                   ) + c.data_entrada
+               )::timestamptz
+         WHERE c.data_entrada IS NOT NULL
+    """)
+    op.execute(f"""
+        UPDATE ciclos_pesagem c
+           SET data_saida_ts = (
+                   COALESCE(
+                       (SELECT max(r.data_hora)::date FROM tb_registros_reconhecimento r
+                         WHERE r.ciclo_id = c.id_pesagem AND r.tipo_operacao = 'saida'),
+                       c.data_entrada_ts::date
+                           + CASE WHEN c.data_saida < c.data_entrada THEN 1 ELSE 0 END,
+                       {base}
+                   ) + c.data_saida
+               )::timestamptz
+         WHERE c.data_saida IS NOT NULL
+    """)
+
+    with op.batch_alter_table('ciclos_pesagem', schema=None) as batch_op:
+        batch_op.drop_column('data_entrada')
+        batch_op.drop_column('data_saida')
+        batch_op.alter_column('data_entrada_ts', new_column_name='data_entrada')
+        batch_op.alter_column('data_saida_ts', new_column_name='data_saida')
+
+    # --- tb_pesagens.data_hora: data do ciclo correspondente ---
+    op.add_column('tb_pesagens', sa.Column('data_hora_ts', sa.DateTime(timezone=True), nullable=True))
+    op.execute(f"""
+        UPDATE tb_pesagens p
+           SET data_hora_ts = (
+                   COALESCE(
+                       (SELECT CASE WHEN p.tipo = 'saida' THEN c.data_saida ELSE c.data_entrada END::date
+                          FROM ciclos_pesagem c WHERE c.id_pesagem = p.ciclo_id),
+                       {base}
+                   ) + p.data_hora
+               )::timestamptz
+    """)
+    with op.batch_alter_table('tb_pesagens', schema=None) as batch_op:
+        batch_op.drop_column('data_hora')
+        batch_op.alter_column('data_hora_ts', new_column_name='data_hora', nullable=False)
+
+    # --- índices ---
+    # ciclos em aberto: parcial, só as linhas com data_saida IS NULL
+    op.create_index('ix_ciclos_pesagem_abertos', 'ciclos_pesagem', ['caminhao_id'],
+                    postgresql_where=sa.text('data_saida IS NULL'))
+    op.create_index('ix_ciclos_pesagem_caminhao_id', 'ciclos_pesagem', ['caminhao_id', 'id_pesagem'])
+    op.create_index('ix_ciclos_pesagem_data_entrada', 'ciclos_pesagem', ['data_entrada'])
+    op.create_index('ix_tb_caminhoes_placa_upper', 'tb_caminhoes', [sa.text('upper(placa)')])
+    op.create_index('ix_tb_motoristas_cpf_digitos', 'tb_motoristas',
+                    [sa.text("replace(replace(cpf, '.', ''), '-', '')")])
+    op.create_index('ix_tb_motoristas_cnh', 'tb_motoristas', ['cnh'])
+
+
+def downgrade():
+    op.drop_index('ix_tb_motoristas_cnh', table_name='tb_motoristas')
+    op.drop_index('ix_tb_motoristas_cpf_digitos', table_name='tb_motoristas')
+    op.drop_index('ix_tb_caminhoes_placa_upper', table_name='tb_caminhoes')
+    op.drop_index('ix_ciclos_pesagem_data_entrada', table_name='ciclos_pesagem')
+    op.drop_index('ix_ciclos_pesagem_caminhao_id', table_name='ciclos_pesagem')
+    op.drop_index('ix_ciclos_pesagem_abertos', table_name='ciclos_pesagem')
+
+    # volta para TIME (a data é descartada)
+    with op.batch_alter_table('tb_pesagens', schema=None) as batch_op:
+        batch_op.alter_column('data_hora', type_=sa.Time(), postgresql_using='data_hora::time')
+    with op.batch_alter_table('ciclos_pesagem', schema=None) as batch_op:
+        batch_op.alter_column('data_entrada', type_=sa.Time(), postgresql_using='data_entrada::time')
+        batch_op.alter_column('data_saida', type_=sa.Time(), postgresql_using='data_saida::time')
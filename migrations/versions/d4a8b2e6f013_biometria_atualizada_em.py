@@ -0,0 +1,29 @@
+"""carimbo de alteração da biometria (sincronização da galeria entre workers)
+
+Revision ID: d4a8b2e6f013
+Revises: c9e2a7f31b48
+Create Date: 2026-10-18 20:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4a8b2e6f013'
+down_revision = 'c9e2a7f31b48'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # sem backfill: linhas antigas já estão na carga inicial de cada worker
+    with op.batch_alter_table('tb_motoristas', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('biometria_atualizada_em', sa.DateTime(timezone=True), nullable=True))
+        batch_op.create_index('ix_tb_motoristas_biometria_atualizada_em', ['biometria_atualizada_em'])
+
+
+def downgrade():
+    with op.batch_alter_table('tb_motoristas', schema=None) as batch_op:
+        batch_op.drop_index('ix_tb_motoristas_biometria_atualizada_em')
+        batch_op.drop_column('biometria_atualizada_em')
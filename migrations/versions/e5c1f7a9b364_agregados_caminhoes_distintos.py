@@ -0,0 +1,36 @@
+"""caminhões distintos nos agregados de pesagem
+
+Revision ID: e5c1f7a9b364
+Revises: d4a8b2e6f013
+Create Date: 2026-10-18 21:15:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5c1f7a9b364'
+down_revision = 'd4a8b2e6f013'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # linhas existentes ficam com 0 até: flask --app run recalcular-agregados
+    with op.batch_alter_table('tb_agregados_pesagem', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('caminhoes', sa.Integer(), nullable=False, server_default='0'))
+    op.create_table(
+        'tb_agregados_caminhoes',
+        sa.Column('dia', sa.Date(), nullable=False),
+        sa.Column('dimensao', sa.String(length=16), nullable=False),
+        sa.Column('chave', sa.Text(), nullable=False),
+        sa.Column('caminhao_id', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('dia', 'dimensao', 'chave', 'caminhao_id'),
+    )
+
+
+def downgrade():
+    op.drop_table('tb_agregados_caminhoes')
+    with op.batch_alter_table('tb_agregados_pesagem', schema=None) as batch_op:
+        batch_op.drop_column('caminhoes')
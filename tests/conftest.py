@@ -0,0 +1,21 @@
+import pytest
+from flask import Flask
+
+from app.database import db
+
+
+@pytest.fixture
+def app_db():
+    """App mínima com SQLite em memória e as tabelas dos modelos."""
+    app = Flask(__name__)
+    app.config.update(
+        TESTING=True,
+        SQLALCHEMY_DATABASE_URI="sqlite://",
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+    )
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
@@ -0,0 +1,57 @@
+import csv
+import io
+from datetime import date, datetime
+from zoneinfo import ZoneInfo
+
+from app.database import db
+from app.models import Caminhao, Motorista, CicloPesagem
+from app.services.agregados_service import FUSO
+from app.services.balanca_service import exportar_ciclos
+
+ZONA = ZoneInfo(FUSO)
+
+
+def _ciclo(caminhao, motorista, entrada):
+    db.session.add(CicloPesagem(
+        caminhao_id=caminhao.id_caminhao,
+        motorista_id=motorista.id_motorista,
+        data_entrada=entrada,
+        peso_entrada=15000.0,
+    ))
+
+
+def _ids_exportados(**filtros):
+    texto = "".join(exportar_ciclos("csv", **filtros))
+    return [int(linha["id_pesagem"]) for linha in csv.DictReader(io.StringIO(texto))]
+
+
+def test_exportar_ate_data_pura_inclui_o_ultimo_dia(app_db):
+    caminhao = Caminhao(placa="ABC1D23", modelo="FH 540", empresa="Semensol")
+    motorista = Motorista(cnh="123", cpf="000.000.000-00", nome="Fulano")
+    db.session.add_all([caminhao, motorista])
+    db.session.flush()
+
+    _ciclo(caminhao, motorista, datetime(2025, 3, 1, 7, 0, tzinfo=ZONA))
+    _ciclo(caminhao, motorista, datetime(2025, 3, 31, 22, 30, tzinfo=ZONA))   # último dia, à noite
+    _ciclo(caminhao, motorista, datetime(2025, 4, 1, 0, 10, tzinfo=ZONA))     # fora do período
+    db.session.commit()
+
+    ids = _ids_exportados(inicio=date(2025, 3, 1), fim=date(2025, 3, 31))
+
+    assert ids == [1, 2]
+
+
+def test_exportar_ate_com_hora_e_limite_exclusivo(app_db):
+    caminhao = Caminhao(placa="ABC1D23", modelo="FH 540")
+    motorista = Motorista(cnh="123", cpf="000.000.000-00", nome="Fulano")
+    db.session.add_all([caminhao, motorista])
+    db.session.flush()
+
+    _ciclo(caminhao, motorista, datetime(2025, 3, 31, 8, 0, tzinfo=ZONA))
+    _ciclo(caminhao, motorista, datetime(2025, 3, 31, 12, 0, tzinfo=ZONA))
+    db.session.commit()
+
+    # datetime sem fuso: hora local de AGREGADOS_FUSO
+    ids = _ids_exportados(fim=datetime(2025, 3, 31, 12, 0))
+
+    assert ids == [1]
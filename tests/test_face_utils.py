@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from app.utils.face_utils import _alinhar_so_recorte
+
+
+def _quadro():
+    # gradiente: cada pixel diferente, para conferir o deslocamento do recorte
+    yy, xx = np.mgrid[0:240, 0:320]
+    return np.dstack([xx % 256, yy % 256, (xx + yy) % 256]).astype(np.uint8)
+
+
+@pytest.mark.parametrize("box", [
+    (0, 90, 80, 10),        # encostada no topo
+    (150, 320, 240, 240),   # canto inferior direito
+    (100, 60, 180, 0),      # encostada à esquerda
+])
+def test_face_na_borda_mantem_tamanho(box):
+    top, right, bottom, left = box
+
+    face = _alinhar_so_recorte(_quadro(), box, angle=12.0)
+
+    assert face.shape == (bottom - top, right - left, 3)
+
+
+def test_angulo_zero_na_borda_devolve_a_propria_caixa():
+    rgb = _quadro()
+    box = (0, 90, 80, 10)
+
+    face = _alinhar_so_recorte(rgb, box, angle=0.0)
+
+    np.testing.assert_array_equal(face, rgb[0:80, 10:90])
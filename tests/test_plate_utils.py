@@ -0,0 +1,50 @@
+import numpy as np
+
+from app.utils import plate_utils
+
+
+class _ReaderFalso:
+    """readtext do frame inteiro: placa nítida ocupando boa parte da imagem."""
+
+    def __init__(self, resultados):
+        self.resultados = resultados
+        self.chamadas = 0
+
+    def readtext(self, img, **kwargs):
+        self.chamadas += 1
+        return self.resultados
+
+
+def _bbox(x, y, w, h):
+    return [(x, y), (x + w, y), (x + w, y + h), (x, y + h)]
+
+
+def test_roi_valida_com_score_baixo_cai_no_frame_inteiro(monkeypatch):
+    gray = np.zeros((200, 800), dtype=np.uint8)
+    monkeypatch.setattr(plate_utils, "ROI_ATIVO", True)
+    monkeypatch.setattr(plate_utils, "_propor_regioes_placa", lambda g: [(10, 10, 80, 20)])
+    # ROI: casa a regex, mas com confiança e área mínimas (score bem abaixo do limiar)
+    monkeypatch.setattr(plate_utils, "_ocr_regiao",
+                        lambda reader, g, caixa: [(_bbox(10, 10, 8, 2), "ABC1234", 0.05)])
+    reader = _ReaderFalso([(_bbox(100, 50, 400, 100), "XYZ9K87", 0.95)])
+
+    placa, score = plate_utils._ocr_pipeline(reader, gray)
+
+    assert reader.chamadas == 1
+    assert placa == "XYZ9K87"
+    assert score >= plate_utils.ROI_SCORE_MIN
+
+
+def test_roi_valida_confiavel_dispensa_frame_inteiro(monkeypatch):
+    gray = np.zeros((200, 800), dtype=np.uint8)
+    monkeypatch.setattr(plate_utils, "ROI_ATIVO", True)
+    monkeypatch.setattr(plate_utils, "ROI_SCORE_MIN", 0.3)
+    monkeypatch.setattr(plate_utils, "_propor_regioes_placa", lambda g: [(100, 50, 400, 100)])
+    monkeypatch.setattr(plate_utils, "_ocr_regiao",
+                        lambda reader, g, caixa: [(_bbox(100, 50, 400, 100), "ABC1234", 0.9)])
+    reader = _ReaderFalso([])
+
+    placa, _ = plate_utils._ocr_pipeline(reader, gray)
+
+    assert placa == "ABC1234"
+    assert reader.chamadas == 0